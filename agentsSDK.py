@@ -1,516 +1,3437 @@
+import argparse
 import asyncio
+import contextvars
+import csv
+import glob
+import hashlib
+import heapq
 import os
 import json
+import multiprocessing
+import sqlite3
+import zlib
 import time
 import re
-from typing import List, Dict
+import sys
+import tempfile
+import queue
+import random
+import threading
+import unicodedata
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from difflib import SequenceMatcher
+from functools import partial
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import quote, urlsplit
 
-# Importações do Selenium
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+# Selenium, webdriver-manager, pandas e o Agents SDK são importados sob demanda, nas funções
+# que os usam: os modos sem navegador ou sem LLM (--offline, --reparse-cache, benchmark) não os carregam
+from dotenv import load_dotenv
+
+# Carrega as variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# -----------------------------------------------------------
+# 1. CONFIGURAÇÃO DE AMBIENTE E MODELO
+# -----------------------------------------------------------
+
+# Chave de API (aplicada ao Agents SDK quando os agentes são criados)
+OPENAI_KEY = os.getenv("OPENAI_API_KEY")
+
+MODEL_NAME = "gpt-4o-mini"
+
+# Resolução do ChromeDriver: caminho fixo, versão fixada e memo em disco do caminho resolvido
+CHROMEDRIVER_PATH = os.getenv("CHROMEDRIVER_PATH", "")
+CHROMEDRIVER_VERSION = os.getenv("CHROMEDRIVER_VERSION", "")
+CHROMEDRIVER_MEMO_PATH = os.getenv("CHROMEDRIVER_MEMO_PATH", ".chromedriver.json")
+CHROMEDRIVER_MEMO_TTL = float(os.getenv("CHROMEDRIVER_MEMO_TTL_DAYS", "7")) * 86400
+
+# Configuração do pool de drivers Selenium
+DRIVER_POOL_SIZE = int(os.getenv("DRIVER_POOL_SIZE", "2"))
+DRIVER_POOL_WARMUP = int(os.getenv("DRIVER_POOL_WARMUP", "1"))
+DRIVER_MAX_PAGES = int(os.getenv("DRIVER_MAX_PAGES", "20"))
+DRIVER_ACQUIRE_TIMEOUT = float(os.getenv("DRIVER_ACQUIRE_TIMEOUT", "120"))
+
+# Espera por prontidão da página (substitui o sleep fixo de 5 segundos)
+PAGE_READY_TIMEOUT = float(os.getenv("PAGE_READY_TIMEOUT", "15"))
+PAGE_READY_SETTLE = float(os.getenv("PAGE_READY_SETTLE", "1.0"))
+PAGE_READY_EXPECTED = int(os.getenv("PAGE_READY_EXPECTED", "10"))
+
+# Máximo de produtos lidos por página de busca (padrão das ferramentas dos agentes)
+PAGE_RESULT_LIMIT = int(os.getenv("PAGE_RESULT_LIMIT", "10"))
+
+OUTPUT_CSV = 'hp_cartridges_search_data.csv'
+# Produtos únicos em NDJSON, gravados à medida que as páginas terminam (entrada do CSV final)
+OUTPUT_NDJSON = 'hp_cartridges_search_data.ndjson'
+
+# Registros mantidos em memória por bloco na ordenação externa do CSV final
+SORT_CHUNK_SIZE = int(os.getenv("SORT_CHUNK_SIZE", "5000"))
+
+# Cache em disco das páginas de busca (HTML + produtos parseados)
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", "page_cache.sqlite")
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "3600"))
+PAGE_CACHE_MAX_BYTES = int(float(os.getenv("PAGE_CACHE_MAX_MB", "200")) * 1024 * 1024)
+
+# Histórico incremental de produtos e preços
+PRODUCT_STORE_PATH = os.getenv("PRODUCT_STORE_PATH", "hp_cartridges_history.sqlite")
+
+# Alertas de preço durante o crawl: queda mínima (R$ e %), modelos acompanhados e arquivo de saída
+ALERT_DROP_ABS = float(os.getenv("ALERT_DROP_ABS", "10"))
+ALERT_DROP_PCT = float(os.getenv("ALERT_DROP_PCT", "10"))
+ALERT_MODELS = [code.strip().upper() for code in os.getenv("ALERT_MODELS", "").split(",") if code.strip()]
+ALERT_FILE = os.getenv("ALERT_FILE", "price_alerts.ndjson")
+
+# Similaridade mínima de títulos para duplicata (mesmo site) e pareamento (entre sites)
+MATCH_DEDUP_THRESHOLD = float(os.getenv("MATCH_DEDUP_THRESHOLD", "0.92"))
+MATCH_LINK_THRESHOLD = float(os.getenv("MATCH_LINK_THRESHOLD", "0.75"))
+
+# Limites de concorrência da etapa de extração (global e por marketplace)
+EXTRACTION_MAX_CONCURRENCY = int(os.getenv("EXTRACTION_MAX_CONCURRENCY", str(DRIVER_POOL_SIZE)))
+SITE_MAX_CONCURRENCY = {
+    "amazon": int(os.getenv("AMAZON_MAX_CONCURRENCY", "1")),
+    "mercadolivre": int(os.getenv("MERCADOLIVRE_MAX_CONCURRENCY", "1")),
+}
+
+# Execução em lote: processos de extração (cada um com seu pool de drivers) e diretório dos shards
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "2"))
+BATCH_DIR = os.getenv("BATCH_DIR", "lote")
+
+# Camada HTTP leve (httpx) tentada antes do Selenium
+HTTP_FETCH_ENABLED = os.getenv("HTTP_FETCH_ENABLED", "1") == "1"
+HTTP_FETCH_TIMEOUT = float(os.getenv("HTTP_FETCH_TIMEOUT", "15"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "10"))
+
+# Limite de requisições por domínio (token bucket): requisições/s e rajada máxima
+DOMAIN_RATE_LIMIT = float(os.getenv("DOMAIN_RATE_LIMIT", "0.5"))
+DOMAIN_RATE_BURST = int(os.getenv("DOMAIN_RATE_BURST", "2"))
+
+# Novas tentativas com backoff exponencial (com jitter) para falhas de navegação e de driver
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "2.0"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))
+
+# Disjuntor por marketplace: bloqueios seguidos até pausar o site e duração da pausa (s)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN", "300"))
+
+# Rastreamento por etapa em JSON lines (vazio = desativado)
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+
+# Perfilamento do laço de extração: "cprofile", "pyinstrument" ou vazio (desativado)
+PROFILE_EXTRACTION = os.getenv("PROFILE_EXTRACTION", "").lower()
+PROFILE_OUTPUT = os.getenv("PROFILE_OUTPUT", "extraction_profile")
+
+# -----------------------------------------------------------
+# 2. DEFINIÇÃO DAS FERRAMENTAS (TOOLS)
+# -----------------------------------------------------------
+
+# Span ativo no contexto atual (propagado para as threads pelo ExtractionScheduler)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    Etapa cronometrada do pipeline. Atributos podem ser adicionados durante a execução.
+    """
+    __slots__ = ("name", "span_id", "parent_id", "attributes")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class _NoopSpan:
+    """
+    Span usado com o rastreamento desativado: não registra nada.
+    """
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Grava spans e métricas do pipeline em JSON lines, um registro por linha, no formato
+    dos spans do OpenTelemetry (trace_id, span_id, parent_span_id, tempos em nanossegundos).
+    Desativado quando não há arquivo configurado. Seguro para uso a partir de várias threads.
+    """
+
+    def __init__(self, path: str = TRACE_FILE):
+        self._lock = threading.Lock()
+        self._file = None
+        self.configure(path)
+
+    def configure(self, path: Optional[str]):
+        """
+        Define o arquivo de saída (None ou vazio desativa) e inicia um novo trace.
+        """
+        self.close()
+        self.path = path or None
+        self.enabled = self.path is not None
+        self.trace_id = uuid.uuid4().hex
+
+    def _emit(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line + "\n")
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Cronometra o bloco `with` como um span filho do span ativo.
+        """
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+        parent = _current_span.get()
+        span = Span(name, parent.span_id if parent is not None else None, attributes)
+        token = _current_span.set(span)
+        start_ns = time.time_ns()
+        start = time.perf_counter()
+        status = "OK"
+        try:
+            yield span
+        except BaseException as e:
+            status = "ERROR"
+            span.attributes.setdefault("erro", repr(e))
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            _current_span.reset(token)
+            self._emit({
+                "tipo": "span",
+                "name": name,
+                "trace_id": self.trace_id,
+                "span_id": span.span_id,
+                "parent_span_id": span.parent_id,
+                "start_time_unix_nano": start_ns,
+                "end_time_unix_nano": start_ns + int(duration * 1e9),
+                "duration_ms": round(duration * 1000, 3),
+                "status": status,
+                "thread": threading.current_thread().name,
+                "attributes": span.attributes,
+            })
+
+    def metric(self, name: str, value: float, unit: str = "", **attributes):
+        """
+        Registra uma medida pontual associada ao span ativo.
+        """
+        if not self.enabled:
+            return
+        parent = _current_span.get()
+        self._emit({
+            "tipo": "metrica",
+            "name": name,
+            "trace_id": self.trace_id,
+            "parent_span_id": parent.span_id if parent is not None else None,
+            "time_unix_nano": time.time_ns(),
+            "value": value,
+            "unit": unit,
+            "attributes": attributes,
+        })
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# Rastreador compartilhado por todas as etapas do pipeline
+TRACER = Tracer()
+
+
+class ExtractionProfiler:
+    """
+    Perfilamento opcional do laço de extração (cProfile ou pyinstrument), ativado por
+    `PROFILE_EXTRACTION`. As chamadas são serializadas enquanto o perfilador está ligado,
+    e o relatório acumulado é gravado em `PROFILE_OUTPUT` ao final da execução.
+    """
+
+    def __init__(self, mode: str = PROFILE_EXTRACTION, output: str = PROFILE_OUTPUT):
+        self.mode = mode
+        self.output = output
+        self._lock = threading.Lock()
+        self._profiler = None
+        self._sessions = []
+        if mode == "cprofile":
+            import cProfile
+            self._profiler = cProfile.Profile()
+        elif mode == "pyinstrument":
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                print("[PERFIL] ⚠️ pyinstrument não instalado: perfilamento desativado")
+                self.mode = ""
+        elif mode:
+            print(f"[PERFIL] ⚠️ Perfilador desconhecido '{mode}': use cprofile ou pyinstrument")
+            self.mode = ""
+
+    @contextmanager
+    def profile(self):
+        if not self.mode:
+            yield
+            return
+        with self._lock:
+            if self.mode == "cprofile":
+                self._profiler.enable()
+                try:
+                    yield
+                finally:
+                    self._profiler.disable()
+            else:
+                from pyinstrument import Profiler
+                profiler = Profiler()
+                profiler.start()
+                try:
+                    yield
+                finally:
+                    profiler.stop()
+                    self._sessions.append(profiler.last_session)
+
+    def dump(self) -> Optional[str]:
+        """
+        Grava o relatório acumulado e devolve o caminho do arquivo (None se desativado).
+        """
+        if self.mode == "cprofile":
+            path = f"{self.output}.prof"
+            self._profiler.dump_stats(path)
+        elif self.mode == "pyinstrument" and self._sessions:
+            from pyinstrument.session import Session
+            from pyinstrument.renderers import HTMLRenderer
+            session = self._sessions[0]
+            for other in self._sessions[1:]:
+                session = Session.combine(session, other)
+            path = f"{self.output}.html"
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(HTMLRenderer().render(session))
+        else:
+            return None
+        print(f"[PERFIL] 🔬 Perfil da extração gravado em {path}")
+        return path
+
+
+EXTRACTION_PROFILER = ExtractionProfiler()
+
+
+# Caminho do ChromeDriver resolvido neste processo (None = Selenium Manager)
+_chromedriver_path: Optional[str] = None
+_chromedriver_resolved = False
+_chromedriver_lock = threading.Lock()
+
+
+def _read_chromedriver_memo() -> Optional[Dict]:
+    try:
+        with open(CHROMEDRIVER_MEMO_PATH, encoding='utf-8') as f:
+            memo = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(memo, dict) or not os.path.isfile(memo.get("path") or ""):
+        return None
+    if CHROMEDRIVER_VERSION and memo.get("version") != CHROMEDRIVER_VERSION:
+        return None
+    return memo
+
+
+def _write_chromedriver_memo(path: str):
+    memo = {"path": path, "version": CHROMEDRIVER_VERSION or None, "resolved_at": time.time()}
+    try:
+        with open(CHROMEDRIVER_MEMO_PATH + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(memo, f)
+        os.replace(CHROMEDRIVER_MEMO_PATH + ".tmp", CHROMEDRIVER_MEMO_PATH)
+    except OSError as e:
+        print(f"[DRIVER] ⚠️ Não foi possível gravar o memo do ChromeDriver: {e}")
+
+
+def _resolve_chromedriver() -> Optional[str]:
+    if CHROMEDRIVER_PATH:
+        return CHROMEDRIVER_PATH
+    memo = _read_chromedriver_memo()
+    if memo and time.time() - memo.get("resolved_at", 0) <= CHROMEDRIVER_MEMO_TTL:
+        return memo["path"]
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+        path = ChromeDriverManager(driver_version=CHROMEDRIVER_VERSION or None).install()
+    except Exception as e:
+        if memo:
+            print(f"[DRIVER] ⚠️ webdriver-manager falhou ({e}); usando o ChromeDriver do memo vencido")
+            return memo["path"]
+        print(f"[DRIVER] ⚠️ webdriver-manager falhou ({e}); o Selenium Manager vai localizar o driver")
+        return None
+    _write_chromedriver_memo(path)
+    return path
+
+
+def resolve_chromedriver_path() -> Optional[str]:
+    """
+    Caminho do executável do ChromeDriver, resolvido uma única vez por processo:
+    `CHROMEDRIVER_PATH`, se definido; senão o memo em disco, se estiver na validade e
+    na versão fixada (`CHROMEDRIVER_VERSION`); senão o webdriver-manager, que atualiza
+    o memo. Sem rede, usa o memo vencido ou devolve None (o Selenium Manager procura
+    o driver localmente).
+    """
+    global _chromedriver_path, _chromedriver_resolved
+    with _chromedriver_lock:
+        if not _chromedriver_resolved:
+            with TRACER.span("driver.resolucao") as span:
+                _chromedriver_path = _resolve_chromedriver()
+                span.set(caminho=_chromedriver_path)
+            _chromedriver_resolved = True
+            print(f"[DRIVER] 📌 ChromeDriver: {_chromedriver_path or 'Selenium Manager'}")
+        return _chromedriver_path
+
+
+def initialize_selenium_driver():
+    """
+    Inicializa o driver do Chrome com configurações otimizadas.
+    """
+    try:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+        
+        chrome_options = Options()
+        chrome_options.add_argument("--headless")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--window-size=1920,1080")
+        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        chrome_options.add_experimental_option('useAutomationExtension', False)
+        chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+        
+        service = Service(resolve_chromedriver_path())
+        driver = webdriver.Chrome(service=service, options=chrome_options)
+        
+        # Remove propriedades que indicam automação
+        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        
+        return driver
+    except Exception as e:
+        return f"ERRO NO DRIVER: Falha ao inicializar o driver Selenium. Mensagem: {e}"
+
+
+class ExtractionError(RuntimeError):
+    """
+    Falha tipada na extração de uma página de busca. `kind` identifica a causa e
+    `retryable` indica se vale tentar de novo. Atravessa as ferramentas dos agentes
+    como JSON (`to_payload` / `from_payload`).
+    """
+    kind = "extracao"
+    retryable = False
+
+    def __init__(self, message: str, site: Optional[str] = None, url: Optional[str] = None):
+        super().__init__(message)
+        self.site = site
+        self.url = url
+
+    def to_payload(self) -> Dict:
+        return {"erro": {"tipo": self.kind, "mensagem": str(self), "site": self.site, "url": self.url}}
+
+    @staticmethod
+    def from_payload(payload: Dict) -> "ExtractionError":
+        error = payload["erro"]
+        error_class = _EXTRACTION_ERRORS.get(error.get("tipo"), ExtractionError)
+        return error_class(error.get("mensagem", ""), error.get("site"), error.get("url"))
+
+
+class DriverPoolError(ExtractionError):
+    """
+    Erro ao obter um driver do pool (falha de inicialização ou timeout).
+    """
+    kind = "driver"
+    retryable = True
+
+
+class NavigationError(ExtractionError):
+    """
+    Falha do navegador ao abrir a página de busca.
+    """
+    kind = "navegacao"
+    retryable = True
+
+
+class BlockedError(ExtractionError):
+    """
+    O marketplace respondeu com uma página de desafio anti-bot.
+    """
+    kind = "bloqueio"
+    retryable = True
+
+
+class CircuitOpenError(ExtractionError):
+    """
+    O marketplace está pausado pelo disjuntor após bloqueios seguidos.
+    """
+    kind = "circuito_aberto"
+
+
+class CacheMissError(ExtractionError):
+    """
+    Página ausente do cache no modo offline.
+    """
+    kind = "cache_offline"
+
+
+class InvalidOutputError(ExtractionError):
+    """
+    A saída da ferramenta (repassada pelo agente) não é um JSON de produtos.
+    """
+    kind = "saida_invalida"
+
+
+_EXTRACTION_ERRORS = {
+    error_class.kind: error_class
+    for error_class in (ExtractionError, DriverPoolError, NavigationError, BlockedError,
+                        CircuitOpenError, CacheMissError, InvalidOutputError)
+}
+
+
+class _PooledDriver:
+    """
+    Driver do pool com o contador de páginas servidas desde a última reciclagem.
+    """
+    __slots__ = ("driver", "pages")
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+
+class SeleniumDriverPool:
+    """
+    Pool limitado de sessões Chrome headless reutilizáveis entre chamadas das ferramentas.
+
+    Os drivers são criados sob demanda até `size`, verificados antes de cada empréstimo
+    e reciclados após `max_pages` páginas. Seguro para uso a partir de várias threads.
+    Depois de `shutdown()`, um novo empréstimo (ou `warm_up()`) reabre o pool, o que
+    permite executar `main()` mais de uma vez no mesmo processo.
+    """
+
+    def __init__(self, size: int = DRIVER_POOL_SIZE, max_pages: int = DRIVER_MAX_PAGES,
+                 acquire_timeout: float = DRIVER_ACQUIRE_TIMEOUT):
+        self.size = max(1, size)
+        self.max_pages = max(1, max_pages)
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        # Métricas
+        self._acquire_waits: List[float] = []
+        self._restarts = 0
+        self._pages_served = 0
+
+    def _create(self) -> _PooledDriver:
+        with TRACER.span("driver.inicializacao") as span:
+            driver_or_error = initialize_selenium_driver()
+            span.set(ok=not isinstance(driver_or_error, str))
+        if isinstance(driver_or_error, str):
+            with self._lock:
+                self._created -= 1
+            raise DriverPoolError(driver_or_error)
+        return _PooledDriver(driver_or_error)
+
+    @staticmethod
+    def _quit(entry: _PooledDriver):
+        try:
+            entry.driver.quit()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_healthy(entry: _PooledDriver) -> bool:
+        try:
+            entry.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def _reserve_slot(self) -> bool:
+        with self._lock:
+            if self._closed:
+                # Nova execução após o encerramento: reabre o pool com métricas zeradas
+                self._closed = False
+                self._acquire_waits = []
+                self._restarts = 0
+                self._pages_served = 0
+                print("[POOL] 🔄 Pool de drivers reaberto")
+            if self._created < self.size:
+                self._created += 1
+                return True
+            return False
+
+    def _restart(self, entry: _PooledDriver) -> _PooledDriver:
+        self._quit(entry)
+        with self._lock:
+            self._restarts += 1
+        # O slot continua reservado: apenas substitui o driver
+        return self._create()
+
+    def warm_up(self, count: int = DRIVER_POOL_WARMUP):
+        """
+        Pré-inicializa até `count` drivers para que o primeiro empréstimo não pague a inicialização.
+        """
+        for _ in range(min(count, self.size)):
+            if not self._reserve_slot():
+                break
+            try:
+                self._idle.put(self._create())
+            except DriverPoolError as e:
+                print(f"[POOL] ⚠️ Falha no pré-aquecimento: {e}")
+                break
+        print(f"[POOL] 🔥 {self._idle.qsize()} driver(s) pré-aquecido(s)")
+
+    def acquire(self) -> _PooledDriver:
+        start = time.perf_counter()
+        try:
+            entry = self._idle.get_nowait()
+        except queue.Empty:
+            if self._reserve_slot():
+                entry = self._create()
+            else:
+                try:
+                    entry = self._idle.get(timeout=self.acquire_timeout)
+                except queue.Empty:
+                    raise DriverPoolError(
+                        f"ERRO NO DRIVER: Nenhum driver disponível após {self.acquire_timeout}s."
+                    )
+        if not self._is_healthy(entry):
+            print("[POOL] ♻️ Driver sem resposta, reiniciando...")
+            entry = self._restart(entry)
+        with self._lock:
+            self._acquire_waits.append(time.perf_counter() - start)
+        return entry
+
+    def release(self, entry: _PooledDriver):
+        entry.pages += 1
+        with self._lock:
+            self._pages_served += 1
+            closed = self._closed
+        if closed:
+            self._quit(entry)
+            with self._lock:
+                self._created -= 1
+            return
+        if entry.pages >= self.max_pages:
+            print(f"[POOL] ♻️ Reciclando driver após {entry.pages} páginas")
+            try:
+                entry = self._restart(entry)
+            except DriverPoolError:
+                return
+        self._idle.put(entry)
+
+    @contextmanager
+    def borrow(self):
+        """
+        Empresta um driver do pool e o devolve ao final do bloco `with`.
+        """
+        entry = self.acquire()
+        try:
+            yield entry.driver
+        finally:
+            self.release(entry)
+
+    def shutdown(self):
+        """
+        Encerra todos os drivers ociosos; os emprestados são encerrados ao serem devolvidos.
+        """
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(entry)
+            with self._lock:
+                self._created -= 1
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            waits = list(self._acquire_waits)
+            return {
+                "drivers_ativos": self._created,
+                "emprestimos": len(waits),
+                "espera_media_s": sum(waits) / len(waits) if waits else 0.0,
+                "espera_max_s": max(waits) if waits else 0.0,
+                "reinicios": self._restarts,
+                "paginas_servidas": self._pages_served,
+            }
+
+
+# Pool compartilhado pelas ferramentas de extração
+DRIVER_POOL = SeleniumDriverPool()
+
+
+# Tempos até a página ficar pronta, por marketplace
+_page_ready_times: Dict[str, List[float]] = {}
+_page_ready_lock = threading.Lock()
+
+
+def wait_for_search_results(driver, site: str) -> float:
+    """
+    Aguarda os contêineres de resultado do marketplace aparecerem na página.
+
+    Sai assim que `PAGE_READY_EXPECTED` resultados estiverem presentes, ou quando a contagem
+    parar de crescer por `PAGE_READY_SETTLE` segundos, ou no timeout.
+    Retorna o tempo até a página ficar pronta (em segundos).
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import TimeoutException
+    
+    selectors = SITE_REGISTRY[site].wait_selectors
+    start = time.perf_counter()
+    state = {"count": 0, "changed_at": start}
+
+    def results_ready(drv):
+        count = max(len(drv.find_elements(By.CSS_SELECTOR, sel)) for sel in selectors)
+        now = time.perf_counter()
+        if count != state["count"]:
+            state["count"] = count
+            state["changed_at"] = now
+        if count >= PAGE_READY_EXPECTED:
+            return True
+        # Menos resultados que o esperado, mas a página estabilizou
+        return count > 0 and now - state["changed_at"] >= PAGE_READY_SETTLE
+
+    try:
+        WebDriverWait(driver, PAGE_READY_TIMEOUT, poll_frequency=0.25).until(results_ready)
+    except TimeoutException:
+        print(f"[TOOL] ⚠️ Timeout de {PAGE_READY_TIMEOUT}s aguardando resultados ({state['count']} encontrados)")
+
+    elapsed = time.perf_counter() - start
+    with _page_ready_lock:
+        _page_ready_times.setdefault(site, []).append(elapsed)
+    print(f"[TOOL] ⏱️ Página pronta em {elapsed:.2f}s ({state['count']} resultados)")
+    return elapsed
+
+
+def page_ready_metrics() -> Dict[str, Dict[str, float]]:
+    """
+    Resumo dos tempos até a página ficar pronta, por marketplace.
+    """
+    with _page_ready_lock:
+        snapshot = {site: list(times) for site, times in _page_ready_times.items()}
+    return {
+        site: {
+            "paginas": len(times),
+            "media_s": sum(times) / len(times),
+            "max_s": max(times),
+            # Economia em relação ao antigo time.sleep(5) fixo
+            "economia_s": sum(5.0 - t for t in times),
+        }
+        for site, times in snapshot.items() if times
+    }
+
+
+class ExtractionScheduler:
+    """
+    Executa o trabalho bloqueante do Selenium em threads, sem travar o event loop,
+    respeitando um limite global e um limite por marketplace.
+    """
+
+    def __init__(self, max_concurrency: int = EXTRACTION_MAX_CONCURRENCY,
+                 site_limits: Optional[Dict[str, int]] = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.site_limits = dict(SITE_MAX_CONCURRENCY if site_limits is None else site_limits)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Os semáforos são criados no event loop em execução (asyncio.run cria um loop novo)
+        self._loop = None
+        self._global_sem: Optional[asyncio.Semaphore] = None
+        self._site_sems: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphores(self, site: str):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._global_sem = asyncio.Semaphore(self.max_concurrency)
+            self._site_sems = {}
+        if site not in self._site_sems:
+            limit = self.site_limits.get(site, self.max_concurrency)
+            self._site_sems[site] = asyncio.Semaphore(max(1, limit))
+        return self._global_sem, self._site_sems[site]
+
+    @asynccontextmanager
+    async def slot(self, site: str):
+        """
+        Ocupa uma vaga global e uma do marketplace durante o bloco `async with`.
+        """
+        global_sem, site_sem = self._semaphores(site)
+        async with site_sem:
+            async with global_sem:
+                yield
+
+    async def run_in_thread(self, func, *args):
+        """
+        Executa `func(*args)` em uma thread do executor (chamar com uma vaga ocupada).
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                thread_name_prefix="extracao")
+        loop = asyncio.get_running_loop()
+        # Copia o contexto para que os spans da thread fiquem sob o span de quem chamou
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, partial(context.run, func, *args))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# Agendador compartilhado pelas ferramentas de extração
+EXTRACTION_SCHEDULER = ExtractionScheduler()
+
+
+class DomainRateLimiter:
+    """
+    Token bucket por domínio: até `burst` requisições seguidas e, depois, `rate` por segundo.
+
+    Cada chamada reserva o horário da sua requisição sob lock (o saldo pode ficar negativo,
+    formando a fila), então o mesmo limitador serve às corrotinas da camada HTTP e às
+    threads do Selenium. Com `rate <= 0`, não limita.
+    """
+
+    def __init__(self, rate: float = DOMAIN_RATE_LIMIT, burst: int = DOMAIN_RATE_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, tuple] = {}
+        self._requests: Dict[str, int] = {}
+        self._waited: Dict[str, float] = {}
+
+    def reserve(self, url: str) -> float:
+        """
+        Reserva uma requisição para o domínio da URL e devolve quantos segundos esperar.
+        """
+        domain = urlsplit(url).netloc
+        with self._lock:
+            self._requests[domain] = self._requests.get(domain, 0) + 1
+            if self.rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(domain, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate) - 1
+            self._buckets[domain] = (tokens, now)
+            wait = -tokens / self.rate if tokens < 0 else 0.0
+            self._waited[domain] = self._waited.get(domain, 0.0) + wait
+        return wait
+
+    async def acquire(self, url: str):
+        wait = self.reserve(url)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_blocking(self, url: str):
+        wait = self.reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                domain: {"requisicoes": count, "espera_total_s": self._waited.get(domain, 0.0)}
+                for domain, count in self._requests.items()
+            }
+
+
+# Limitador compartilhado pela camada HTTP e pelo Selenium
+RATE_LIMITER = DomainRateLimiter()
+
+
+class CircuitBreaker:
+    """
+    Disjuntor por marketplace: após `threshold` bloqueios seguidos, o site fica pausado
+    por `cooldown` segundos e as páginas dele falham na hora com `CircuitOpenError`.
+    Passada a pausa, uma única tentativa decide se o site volta (sucesso) ou pausa de novo.
+    """
+
+    def __init__(self, threshold: int = CIRCUIT_FAILURE_THRESHOLD, cooldown: float = CIRCUIT_COOLDOWN):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures: Dict[str, int] = {}
+        self._opened_at: Dict[str, float] = {}
+        self._trial: Dict[str, bool] = {}
+        self._openings: Dict[str, int] = {}
+
+    def check(self, site: str, url: Optional[str] = None):
+        """
+        Levanta `CircuitOpenError` se o site estiver pausado.
+        """
+        with self._lock:
+            opened_at = self._opened_at.get(site)
+            if opened_at is None:
+                return
+            remaining = self.cooldown - (time.monotonic() - opened_at)
+            if remaining <= 0 and not self._trial.get(site):
+                # Meia-abertura: libera uma tentativa de teste
+                self._trial[site] = True
+                return
+        raise CircuitOpenError(
+            f"{SITE_REGISTRY[site].name} pausado após bloqueios seguidos "
+            f"(retoma em {max(remaining, 0):.0f}s)", site, url,
+        )
+
+    def record_success(self, site: str):
+        with self._lock:
+            self._failures[site] = 0
+            self._opened_at.pop(site, None)
+            self._trial[site] = False
+
+    def record_failure(self, site: str, blocked: bool):
+        """
+        Registra uma falha; apenas bloqueios contam para abrir o disjuntor.
+        """
+        with self._lock:
+            trial = self._trial.get(site, False)
+            self._trial[site] = False
+            if not blocked:
+                return
+            self._failures[site] = self._failures.get(site, 0) + 1
+            if not trial and self._failures[site] < self.threshold:
+                return
+            self._opened_at[site] = time.monotonic()
+            self._openings[site] = self._openings.get(site, 0) + 1
+        print(f"[CIRCUITO] 🛑 {SITE_REGISTRY[site].name} pausado por {self.cooldown:.0f}s após bloqueios seguidos")
+
+    def metrics(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                site: {"aberturas": count, "aberto": site in self._opened_at}
+                for site, count in self._openings.items()
+            }
+
+
+# Disjuntor compartilhado pelas ferramentas de extração
+CIRCUIT_BREAKER = CircuitBreaker()
+
+
+def retry_delay(attempt: int) -> float:
+    """
+    Espera antes da próxima tentativa: backoff exponencial com jitter completo.
+    """
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+# -----------------------------------------------------------
+# Motor de extração: padrões pré-compilados aplicados por contêiner
+# -----------------------------------------------------------
+
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def _marker_regex(markers) -> Optional["re.Pattern"]:
+    """
+    Regex que encontra qualquer um dos trechos, sem diferenciar maiúsculas. Permite
+    procurar âncoras e marcadores direto no HTML, sem criar uma cópia em minúsculas.
+    """
+    markers = [marker for marker in markers if marker]
+    if not markers:
+        return None
+    return re.compile("|".join(re.escape(marker) for marker in markers), re.IGNORECASE)
+
+
+class FieldRule:
+    """
+    Regra de extração de um campo: cascata de padrões pré-compilados em ordem de prioridade.
+
+    Cada padrão tem uma âncora literal (em minúsculas) que precisa estar presente no
+    contêiner para que a regex seja executada, o que evita varrer o HTML com padrões
+    que não têm como casar. `convert` transforma o match em valor (None descarta o
+    match) e `accept` decide se a cascata para ou tenta o próximo padrão.
+    """
+    __slots__ = ("patterns", "convert", "accept", "default")
+
+    def __init__(self, patterns, convert, accept=None, default=None, flags=0):
+        self.patterns = [(re.compile(pattern, flags), anchor) for pattern, anchor in patterns]
+        self.convert = convert
+        self.accept = accept
+        self.default = default
+
+    def extract(self, html: str, lowered: str, start: int = 0, end: Optional[int] = None,
+                hits: Optional[List[int]] = None):
+        """
+        Aplica a cascata ao contêiner `html[start:end]`, buscando direto na página
+        (com `pos`/`endpos`), sem copiar o trecho; `lowered` é o contêiner em minúsculas,
+        usado só para as âncoras. Se `hits` for informado (uma posição por padrão mais
+        uma para o valor padrão), conta qual padrão forneceu o valor final.
+        """
+        if end is None:
+            end = len(html)
+        value = self.default
+        source = len(self.patterns)
+        for index, (regex, anchor) in enumerate(self.patterns):
+            if anchor is not None and anchor not in lowered:
+                continue
+            match = regex.search(html, start, end)
+            if not match:
+                continue
+            try:
+                converted = self.convert(match)
+            except ValueError:
+                continue
+            if converted is None:
+                continue
+            value = converted
+            source = index
+            if self.accept is None or self.accept(value):
+                break
+        if hits is not None:
+            hits[source] += 1
+        return value
+
+
+def _clean_text(match) -> Optional[str]:
+    text = match.group(1)
+    if text is None:
+        return None
+    return _TAG_RE.sub('', text.strip()).strip()
+
+
+def _amazon_price(match) -> float:
+    if len(match.groups()) == 2:  # Padrão whole/fraction
+        whole, fraction = match.groups()
+        return float(whole.replace(',', '') + '.' + fraction)
+    return float(match.group(1).replace(',', '.'))
+
+
+def _decimal_comma(match) -> float:
+    return float(match.group(1).replace(',', '.'))
+
+
+def _brl_amount(match) -> float:
+    return float(match.group(1).replace('.', '').replace(',', '.'))
+
+
+def _mercadolivre_link(match) -> str:
+    link = match.group(1)
+    if not link.startswith('http'):
+        link = f"https://www.mercadolivre.com.br{link}"
+    return link
+
+
+class ContainerRule:
+    """
+    Localiza os contêineres de produto em uma única passada pelo HTML.
+
+    Em vez de tentar a regex em cada `<div`/`<li` da página, procura a âncora literal
+    com `str.find`, casa a tag de abertura a partir dela e busca o fechamento com
+    `search` (equivalente ao `(.*?)` não guloso do padrão original, mas usando a busca
+    literal do motor de regex). Produz os mesmos contêineres, sem sobreposição, que o
+    `re.findall` com `open_pattern + (.*?) + close_pattern`.
+    """
+    __slots__ = ("open_re", "close_re", "anchor", "tag_open")
+
+    def __init__(self, open_pattern: str, close_pattern: str, anchor: str, tag_open: str):
+        self.open_re = re.compile(open_pattern)
+        self.close_re = re.compile(close_pattern)
+        self.anchor = anchor
+        self.tag_open = tag_open
+
+    def finditer(self, html: str):
+        """
+        Gera `(match_da_abertura, inicio_do_corpo, fim_do_corpo)` para cada contêiner.
+        """
+        pos = 0
+        idx = html.find(self.anchor)
+        while idx != -1:
+            start = html.rfind(self.tag_open, pos, idx)
+            opening = self.open_re.match(html, start) if start != -1 else None
+            closing = self.close_re.search(html, opening.end()) if opening else None
+            if closing:
+                yield opening, opening.end(), closing.start()
+                pos = closing.end()
+                idx = html.find(self.anchor, max(pos, idx + 1))
+            else:
+                idx = html.find(self.anchor, idx + 1)
+
+
+class ProductRecord:
+    """
+    Registro compacto de um produto extraído, comum a todos os marketplaces.
+    """
+    __slots__ = ("site", "product_id", "title", "price", "rating", "url")
+
+    def __init__(self, site: str, product_id: str, title: str, price: float, rating: float, url: str):
+        self.site = site
+        self.product_id = product_id
+        self.title = title
+        self.price = price
+        self.rating = rating
+        self.url = url
+
+    @property
+    def available(self) -> bool:
+        # Disponibilidade (assume em estoque se tem preço)
+        return self.price > 0
+
+    def to_row(self) -> Dict:
+        """
+        Converte para o formato de linha usado no JSON das ferramentas e no CSV.
+        """
+        return {
+            "Nome do Produto": self.title,
+            "Preço (R$)": self.price,
+            "Avaliação (estrelas)": self.rating,
+            "URL": self.url,
+            "Disponibilidade": "Em estoque" if self.available else "Indisponível",
+            SITE_REGISTRY[self.site].id_field: self.product_id,
+        }
+
+    def __repr__(self):
+        return f"ProductRecord({self.site}:{self.product_id}, {self.title[:30]!r}, R$ {self.price})"
+
+
+class IdRule:
+    """
+    Regra do identificador do produto: um grupo da tag de abertura do contêiner
+    (`container_group`) ou um padrão aplicado sobre um campo já extraído (`field`).
+    """
+    __slots__ = ("container_group", "field", "regex", "default")
+
+    def __init__(self, container_group: Optional[int] = None, field: Optional[str] = None,
+                 pattern: Optional[str] = None, default: str = "N/A"):
+        self.container_group = container_group
+        self.field = field
+        self.regex = re.compile(pattern) if pattern else None
+        self.default = default
+
+    def resolve(self, opening, fields: Dict) -> str:
+        if self.container_group is not None:
+            return opening.group(self.container_group)
+        value = fields.get(self.field)
+        if value and self.regex is not None:
+            match = self.regex.search(value)
+            return match.group(1) if match else self.default
+        return value or self.default
+
+
+class SiteExtractor:
+    """
+    Descrição declarativa de um marketplace: contêineres, regras de campo, regra de ID,
+    seletores de prontidão e URLs de busca paginada.
+    Campos obrigatórios: `title`, `price` e `rating`.
+
+    `search_url` e `page_url` recebem `{query}` (termos unidos por `query_separator`),
+    `{page}` e `{offset}` (posição do primeiro resultado da página, base 1).
+    """
+    __slots__ = ("key", "name", "id_field", "containers", "fields", "id_rule",
+                 "url_template", "url_field", "wait_selectors",
+                 "search_url", "page_url", "page_size", "query_separator", "challenge_markers",
+                 "challenge_re")
+
+    def __init__(self, key: str, name: str, id_field: str, containers: List[ContainerRule],
+                 fields: Dict[str, FieldRule], id_rule: IdRule, url_template: str,
+                 wait_selectors: List[str], search_url: str, page_url: str,
+                 page_size: int, query_separator: str, url_field: Optional[str] = None,
+                 challenge_markers: tuple = ()):
+        self.key = key
+        self.name = name
+        self.id_field = id_field
+        self.containers = containers
+        self.fields = fields
+        self.id_rule = id_rule
+        self.url_template = url_template
+        self.url_field = url_field
+        self.wait_selectors = wait_selectors
+        self.search_url = search_url
+        self.page_url = page_url
+        self.page_size = page_size
+        self.query_separator = query_separator
+        # Trechos (em minúsculas) que identificam a página de desafio anti-bot do marketplace
+        self.challenge_markers = challenge_markers
+        self.challenge_re = _marker_regex(challenge_markers)
+
+    def has_containers(self, html: str) -> bool:
+        """
+        Indica se o HTML traz ao menos um contêiner de produto (para no primeiro encontrado).
+        """
+        return any(next(rule.finditer(html), None) is not None for rule in self.containers)
+
+    def iter_containers(self, html: str, limit: Optional[int] = None):
+        """
+        Contêineres do HTML sob demanda, com a primeira regra de contêiner que encontra
+        algum. Para depois de `limit` contêineres, sem varrer o resto da página.
+        """
+        for rule in self.containers:
+            containers = islice(rule.finditer(html), limit)
+            first = next(containers, None)
+            if first is not None:
+                yield first
+                yield from containers
+                return
+
+    def build_search_url(self, query: str, page: int = 1) -> str:
+        terms = self.query_separator.join(quote(term) for term in query.lower().split())
+        template = self.search_url if page <= 1 else self.page_url
+        return template.format(query=terms, page=page, offset=(page - 1) * self.page_size + 1)
+
+
+# Registro de marketplaces suportados, indexado pela chave do site
+SITE_REGISTRY: Dict[str, SiteExtractor] = {}
+
+
+def register_site(extractor: SiteExtractor) -> SiteExtractor:
+    SITE_REGISTRY[extractor.key] = extractor
+    return extractor
+
+
+register_site(SiteExtractor(
+    key="amazon",
+    name="Amazon",
+    id_field="ASIN",
+    containers=[
+        # Contêineres de produto com data-asin
+        ContainerRule(
+            r'<div[^>]*data-asin="([A-Z0-9]{10})"[^>]*data-component-type="s-search-result"[^>]*>',
+            r'</div>\s*</div>\s*</div>\s*</span>',
+            anchor='data-component-type="s-search-result"',
+            tag_open='<div',
+        ),
+    ],
+    fields={
+        "title": FieldRule(
+            [
+                (r'<h2[^>]*>(.*?)</h2>', '<h2'),
+                (r'<span[^>]*class="[^"]*a-size-base-plus[^"]*"[^>]*>([^<]*)</span>', 'a-size-base-plus'),
+                (r'title":{"text":"([^"]*)"', 'title":{"text":"'),
+            ],
+            _clean_text,
+            accept=lambda title: len(title) > 10,  # Título válido
+            default="N/A",
+            flags=re.DOTALL,
+        ),
+        "price": FieldRule(
+            [
+                (r'<span class="a-price-whole">([0-9,]+)</span><span class="a-price-fraction">([0-9]{2})</span>', 'a-price-whole'),
+                (r'R\$\s*([0-9,]+[.,][0-9]{2})', 'r$'),
+                (r'"price":([0-9.]+)', '"price":'),
+            ],
+            _amazon_price,
+            default=0.0,
+        ),
+        "rating": FieldRule(
+            [
+                (r'aria-hidden="true" class="a-size-small a-color-base">([0-9,]+)</span>', 'a-size-small a-color-base'),
+                (r'"rating_average":([0-9.]+)', '"rating_average":'),
+                (r'([0-9,]+) de 5 estrelas', ' de 5 estrelas'),
+            ],
+            _decimal_comma,
+            default=0.0,
+        ),
+    },
+    id_rule=IdRule(container_group=1),
+    url_template="https://www.amazon.com.br/dp/{id}",
+    wait_selectors=['div[data-component-type="s-search-result"]'],
+    search_url="https://www.amazon.com.br/s?k={query}",
+    page_url="https://www.amazon.com.br/s?k={query}&page={page}",
+    page_size=16,
+    query_separator="+",
+    challenge_markers=("/errors/validatecaptcha", "digite os caracteres que você vê", "api-services-support@amazon"),
+))
+
+register_site(SiteExtractor(
+    key="mercadolivre",
+    name="Mercado Livre",
+    id_field="MLB_ID",
+    # Mesmos seletores do scraper Scrapy
+    containers=[
+        ContainerRule(
+            r'<li[^>]*class="[^"]*ui-search-layout__item[^"]*"[^>]*>',
+            r'</li>',
+            anchor='ui-search-layout__item',
+            tag_open='<li',
+        ),
+        ContainerRule(
+            r'<div[^>]*class="[^"]*andes-card[^"]*poly-card[^"]*"[^>]*>',
+            r'</div>',
+            anchor='poly-card',
+            tag_open='<div',
+        ),
+    ],
+    fields={
+        "title": FieldRule(
+            [
+                # Padrões mais específicos primeiro
+                (r'<h2[^>]*class="[^"]*ui-search-item__title[^"]*"[^>]*>([^<]+)</h2>', 'ui-search-item__title'),
+                (r'<a[^>]*class="[^"]*ui-search-item__group__element[^"]*"[^>]*title="([^"]+)"', 'ui-search-item__group__element'),
+                (r'class="[^"]*ui-search-item__title[^"]*"[^>]*>([^<]+)<', 'ui-search-item__title'),
+                (r'<span[^>]*class="[^"]*ui-search-item__title[^"]*"[^>]*>([^<]+)</span>', 'ui-search-item__title'),
+                (r'<a[^>]*class="[^"]*poly-component__title[^"]*"[^>]*>([^<]+)</a>', 'poly-component__title'),
+                # Padrões mais genéricos
+                (r'ui-search-item__title[^>]*>([^<]{10,})<', 'ui-search-item__title'),  # Título com pelo menos 10 caracteres
+                (r'title="([^"]{10,})"[^>]*ui-search', 'ui-search'),  # Atributo title
+                (r'<a[^>]*>([^<]{15,})</a>[^<]*cartucho|hp', None),  # Link com texto relacionado
+            ],
+            _clean_text,
+            accept=lambda title: len(title) > 5 and not title.isdigit(),
+            default="N/A",
+            flags=re.IGNORECASE,
+        ),
+        "link": FieldRule(
+            [
+                (r'<a[^>]*class="[^"]*ui-search-item__group__element[^"]*"[^>]*href="([^"]*)"', 'ui-search-item__group__element'),
+                (r'<a[^>]*class="[^"]*ui-search-link[^"]*"[^>]*href="([^"]*)"', 'ui-search-link'),
+                (r'<a[^>]*class="[^"]*poly-component__title[^"]*"[^>]*href="([^"]*)"', 'poly-component__title'),
+            ],
+            _mercadolivre_link,
+            default="",
+        ),
+        "price": FieldRule(
+            [
+                (r'class="[^"]*andes-money-amount__fraction[^"]*"[^>]*>([^<]*)</span>', 'andes-money-amount__fraction'),
+                (r'ui-search-price__second-line[^>]*>.*?andes-money-amount__fraction[^>]*>([^<]*)</span>', 'ui-search-price__second-line'),
+                (r'poly-price__current[^>]*>.*?andes-money-amount__fraction[^>]*>([^<]*)</span>', 'poly-price__current'),
+            ],
+            _brl_amount,
+            default=0.0,
+            flags=re.DOTALL,
+        ),
+        "rating": FieldRule(
+            [
+                # Padrões que funcionaram no teste
+                (r'rating[^>]*>([0-9,\.]+)</span>', 'rating'),
+                (r'reviews__rating[^>]*>([0-9,\.]+)', 'reviews__rating'),
+                # Padrões adicionais de backup
+                (r'class="[^"]*ui-search-reviews__rating-number[^"]*"[^>]*>([0-9,\.]+)</span>', 'ui-search-reviews__rating-number'),
+                (r'ui-search-reviews__rating-number[^>]*>([0-9,\.]+)</span>', 'ui-search-reviews__rating-number'),
+                (r'class="[^"]*ui-search-reviews__rating[^"]*"[^>]*>([0-9,\.]+)</span>', 'ui-search-reviews__rating'),
+                (r'rating-number[^>]*>([0-9,\.]+)</span>', 'rating-number'),
+                (r'<span[^>]*>([0-9,\.]+)\s*</span>[^<]*<span[^>]*>\([0-9,\.]+\)</span>', '('),
+                (r'([0-9,\.]+)\s*de\s*5\s*estrelas', 'estrelas'),
+                (r'([0-9,\.]+)\s*estrelas?', 'estrela'),
+            ],
+            _decimal_comma,
+            accept=lambda rating: 0 <= rating <= 5,  # Validação de range válido
+            default=0.0,
+            flags=re.IGNORECASE,
+        ),
+    },
+    # Extrai ID MLB do link
+    id_rule=IdRule(field="link", pattern=r'(MLB-[0-9]+)'),
+    url_template="https://www.mercadolivre.com.br/{id}",
+    url_field="link",
+    wait_selectors=["li.ui-search-layout__item", "div.poly-card"],
+    search_url="https://lista.mercadolivre.com.br/{query}",
+    page_url="https://lista.mercadolivre.com.br/{query}_Desde_{offset}",
+    page_size=50,
+    query_separator="-",
+    challenge_markers=("account-verification", "suspicious-traffic", "/gz/challenge"),
+))
+
+
+def parse_search_html(site: str, html_content: str, limit: Optional[int] = PAGE_RESULT_LIMIT,
+                      field_hits: Optional[Dict[str, List[int]]] = None) -> List[ProductRecord]:
+    """
+    Extrai os produtos do HTML de uma página de busca usando as regras do marketplace.
+    Com `limit=None`, extrai todos os contêineres da página. `field_hits` recebe, por
+    campo, quantas vezes cada padrão da cascata forneceu o valor (último = valor padrão).
+
+    Os contêineres são percorridos sob demanda e os campos são buscados direto no HTML
+    da página, por posição, e a varredura para assim que `limit` produtos foram
+    extraídos. Só o contêiner atual existe em cópia (em minúsculas, para as âncoras):
+    procurar as âncoras sem diferenciar maiúsculas direto na página é ~10x mais lento.
+    """
+    extractor = SITE_REGISTRY[site]
+    
+    if field_hits is not None:
+        for name, rule in extractor.fields.items():
+            field_hits.setdefault(name, [0] * (len(rule.patterns) + 1))
+    
+    # Tempo acumulado por campo, medido apenas com o rastreamento ativo
+    field_times = dict.fromkeys(extractor.fields, 0.0) if TRACER.enabled else None
+    
+    products = []
+    with TRACER.span("extracao.conteineres", site=site, html_chars=len(html_content)) as span:
+        for opening, body_start, body_end in extractor.iter_containers(html_content, limit):
+            lowered = html_content[body_start:body_end].lower()
+            if field_times is not None:
+                fields = {}
+                for name, rule in extractor.fields.items():
+                    start = time.perf_counter()
+                    fields[name] = rule.extract(html_content, lowered, body_start, body_end,
+                                                field_hits[name] if field_hits is not None else None)
+                    field_times[name] += time.perf_counter() - start
+            elif field_hits is None:
+                fields = {name: rule.extract(html_content, lowered, body_start, body_end)
+                          for name, rule in extractor.fields.items()}
+            else:
+                fields = {name: rule.extract(html_content, lowered, body_start, body_end, field_hits[name])
+                          for name, rule in extractor.fields.items()}
+            product_id = extractor.id_rule.resolve(opening, fields)
+            url = fields.get(extractor.url_field) if extractor.url_field else None
+            
+            products.append(ProductRecord(
+                site=site,
+                product_id=product_id,
+                title=fields["title"],
+                price=fields["price"],
+                rating=fields["rating"],
+                url=url or extractor.url_template.format(id=product_id),
+            ))
+        span.set(conteineres=len(products))
+    
+    if field_times is not None:
+        for name, elapsed in field_times.items():
+            TRACER.metric("extracao.campo_ms", round(elapsed * 1000, 3), unit="ms",
+                          site=site, campo=name, conteineres=len(products))
+    
+    return products
+
+
+def parser_fingerprint() -> str:
+    """
+    Identifica a versão das regras de extração registradas. Muda sempre que um padrão
+    é alterado, o que invalida os produtos já parseados no cache (o HTML é mantido).
+    """
+    digest = hashlib.sha1()
+    for key in sorted(SITE_REGISTRY):
+        extractor = SITE_REGISTRY[key]
+        for container in extractor.containers:
+            digest.update(f"{key}|{container.open_re.pattern}|{container.close_re.pattern}".encode())
+        for name, rule in extractor.fields.items():
+            for regex, anchor in rule.patterns:
+                digest.update(f"{key}|{name}|{regex.pattern}|{regex.flags}|{anchor}".encode())
+    return digest.hexdigest()[:12]
+
+
+class PageCache:
+    """
+    Cache em disco (SQLite) das páginas de busca, indexado pela URL.
+
+    Guarda o HTML comprimido e a lista de produtos parseada. Entradas mais antigas que
+    `ttl` segundos são buscadas novamente; quando o tamanho total passa de `max_bytes`,
+    as entradas acessadas há mais tempo são removidas (LRU).
+    """
+
+    def __init__(self, path: str = PAGE_CACHE_PATH, ttl: float = PAGE_CACHE_TTL,
+                 max_bytes: int = PAGE_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = True
+        # Modo offline: usa o cache mesmo vencido e nunca abre o navegador
+        self.offline = False
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        if self._conn is None:
+            # Os workers do modo em lote gravam no mesmo arquivo: WAL e espera em vez de "database is locked"
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30.0)
+            self._conn.execute("PRAGMA busy_timeout = 30000")
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    site TEXT NOT NULL,
+                    html BLOB NOT NULL,
+                    products TEXT,
+                    parser_version TEXT,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    size INTEGER NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_accessed ON pages (accessed_at)")
+        return self._conn
+
+    def get(self, url: str):
+        """
+        Devolve `(html, produtos_ou_None)` da URL, ou None se ausente ou vencida.
+        Os produtos voltam None quando foram parseados por outra versão das regras.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT html, products, parser_version, fetched_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None or (not self.offline and time.time() - row[3] > self.ttl):
+                self.misses += 1
+                return None
+            conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            conn.commit()
+            self.hits += 1
+        html, products, version, _ = row
+        rows = json.loads(products) if products and version == parser_fingerprint() else None
+        return zlib.decompress(html).decode("utf-8"), rows
+
+    def is_fresh(self, url: str) -> bool:
+        """
+        Indica se a URL tem página válida em cache, sem contar acerto ou falta.
+        """
+        if not self.enabled:
+            return False
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT fetched_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        return row is not None and (self.offline or time.time() - row[0] <= self.ttl)
+
+    def put(self, url: str, site: str, html: str, rows: Optional[List[Dict]]):
+        if not self.enabled:
+            return
+        blob = zlib.compress(html.encode("utf-8"), 6)
+        products = json.dumps(rows, ensure_ascii=False) if rows is not None else None
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, site, blob, products, parser_fingerprint(), now, now, len(blob)),
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def update_products(self, url: str, rows: List[Dict]):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "UPDATE pages SET products = ?, parser_version = ? WHERE url = ?",
+                (json.dumps(rows, ensure_ascii=False), parser_fingerprint(), url),
+            )
+            conn.commit()
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, size in conn.execute("SELECT url, size FROM pages ORDER BY accessed_at").fetchall():
+            conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def iter_pages(self, site: Optional[str] = None):
+        """
+        Percorre as páginas em cache como `(url, site, html)`, para reprocessamento offline.
+        """
+        with self._lock:
+            query = "SELECT url, site FROM pages" + (" WHERE site = ?" if site else "") + " ORDER BY url"
+            entries = self._connection().execute(query, (site,) if site else ()).fetchall()
+        for url, page_site in entries:
+            with self._lock:
+                row = self._connection().execute("SELECT html FROM pages WHERE url = ?", (url,)).fetchone()
+            if row:
+                yield url, page_site, zlib.decompress(row[0]).decode("utf-8")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Cache compartilhado das páginas de busca
+PAGE_CACHE = PageCache()
+
+
+def reparse_cache(site: Optional[str] = None) -> Dict[str, int]:
+    """
+    Reaplica as regras de extração atuais a todo o HTML em cache, sem acessar a rede,
+    e atualiza os produtos armazenados. Devolve a quantidade de produtos por URL.
+    """
+    counts = {}
+    for url, page_site, html in PAGE_CACHE.iter_pages(site):
+        rows = [product.to_row() for product in parse_search_html(page_site, html, limit=None)]
+        PAGE_CACHE.update_products(url, rows)
+        counts[url] = len(rows)
+    return counts
+
+
+def fetch_search_html(site: str, url: str) -> str:
+    """
+    Abre a página de busca com um driver do pool e devolve o HTML renderizado.
+    Levanta `NavigationError` se o navegador falhar ao abrir a URL.
+    """
+    from selenium.common.exceptions import WebDriverException
+    
+    with TRACER.span("pool.emprestimo", site=site):
+        entry = DRIVER_POOL.acquire()
+    driver = entry.driver
+    try:
+        RATE_LIMITER.acquire_blocking(url)
+        with TRACER.span("pagina.navegacao", site=site, url=url):
+            try:
+                driver.get(url)
+            except WebDriverException as e:
+                raise NavigationError(f"Falha ao abrir a página: {e.msg or e}", site, url) from e
+        with TRACER.span("pagina.espera", site=site) as span:
+            span.set(pronta_s=round(wait_for_search_results(driver, site), 3))
+        with TRACER.span("pagina.captura", site=site) as span:
+            html_content = driver.page_source
+            span.set(html_chars=len(html_content))
+        return html_content
+    finally:
+        DRIVER_POOL.release(entry)
+
+
+# Trechos genéricos de páginas de desafio anti-bot (usados para classificar o escalonamento)
+BOT_CHALLENGE_MARKERS = ("captcha", "robot check", "não é um robô", "unusual traffic", "tráfego incomum")
+_BOT_CHALLENGE_RE = _marker_regex(BOT_CHALLENGE_MARKERS)
+
+
+class HttpFetcher:
+    """
+    Camada de busca leve: baixa a página de busca por HTTP com um cliente assíncrono
+    (httpx, conexões keep-alive reaproveitadas e respostas comprimidas) e só recorre ao
+    Selenium quando a resposta não traz os contêineres de produto ou parece um desafio
+    anti-bot. Conta, por marketplace, as páginas servidas por HTTP e os escalonamentos.
+
+    O httpx é opcional: sem ele, todas as páginas vão direto para o Selenium.
+    """
+
+    HEADERS = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                      "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+        "Accept-Language": "pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7",
+        "Upgrade-Insecure-Requests": "1",
+        "Sec-Fetch-Dest": "document",
+        "Sec-Fetch-Mode": "navigate",
+        "Sec-Fetch-Site": "none",
+        "Sec-Fetch-User": "?1",
+    }
+
+    def __init__(self, enabled: bool = HTTP_FETCH_ENABLED, timeout: float = HTTP_FETCH_TIMEOUT,
+                 max_connections: int = HTTP_MAX_CONNECTIONS):
+        self.enabled = enabled
+        self.timeout = timeout
+        self.max_connections = max(1, max_connections)
+        self._httpx = None
+        self._client = None
+        # O cliente fica preso ao event loop em que foi criado (asyncio.run cria um loop novo)
+        self._loop = None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict] = {}
+
+    def _get_client(self):
+        if self._httpx is None:
+            try:
+                import httpx
+            except ImportError:
+                print("[HTTP] ⚠️ httpx não instalado: todas as páginas serão abertas no Selenium")
+                self.enabled = False
+                return None
+            self._httpx = httpx
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._loop = loop
+            # Accept-Encoding fica a cargo do httpx (gzip/deflate, e br/zstd se os decodificadores existirem)
+            self._client = self._httpx.AsyncClient(
+                headers=self.HEADERS,
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=self._httpx.Limits(max_connections=self.max_connections,
+                                          max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    @staticmethod
+    def escalation_reason(site: str, html: str) -> Optional[str]:
+        """
+        Motivo para descartar a resposta HTTP e usar o Selenium, ou None se ela serve.
+        """
+        extractor = SITE_REGISTRY[site]
+        # Marcadores procurados direto no HTML: uma cópia em minúsculas dobraria a memória da página
+        if extractor.challenge_re is not None and extractor.challenge_re.search(html):
+            return "desafio"
+        if extractor.has_containers(html):
+            return None
+        if _BOT_CHALLENGE_RE.search(html):
+            return "desafio"
+        return "sem_conteineres"
+
+    def _record(self, site: str, reason: Optional[str]):
+        with self._lock:
+            stats = self._stats.setdefault(site, {"http": 0, "escalacoes": 0, "motivos": {}})
+            if reason is None:
+                stats["http"] += 1
+            else:
+                stats["escalacoes"] += 1
+                stats["motivos"][reason] = stats["motivos"].get(reason, 0) + 1
+
+    async def fetch(self, site: str, url: str) -> Optional[str]:
+        """
+        Baixa a página por HTTP. Devolve o HTML, ou None quando é preciso escalar para o Selenium.
+        """
+        client = self._get_client() if self.enabled else None
+        if client is None:
+            return None
+        html_content = None
+        with TRACER.span("http.busca", site=site, url=url) as span:
+            try:
+                response = await client.get(url)
+            except self._httpx.HTTPError as e:
+                reason = "erro_rede"
+                span.set(erro=repr(e))
+            else:
+                span.set(status=response.status_code, html_bytes=len(response.content))
+                if response.status_code != 200:
+                    reason = f"http_{response.status_code}"
+                else:
+                    html_content = response.text
+                    reason = self.escalation_reason(site, html_content)
+            span.set(escalado=reason is not None, motivo=reason)
+        self._record(site, reason)
+        if reason is not None:
+            print(f"[HTTP] ↪️ {SITE_REGISTRY[site].name}: escalando para o Selenium ({reason})")
+            return None
+        print(f"[HTTP] ⚡ HTML baixado sem navegador: {len(html_content)} caracteres")
+        return html_content
+
+    def metrics(self) -> Dict[str, Dict]:
+        """
+        Por marketplace: páginas servidas por HTTP, escalonamentos, taxa de escalonamento e motivos.
+        """
+        with self._lock:
+            snapshot = {site: dict(stats, motivos=dict(stats["motivos"])) for site, stats in self._stats.items()}
+        for stats in snapshot.values():
+            total = stats["http"] + stats["escalacoes"]
+            stats["taxa_escalacao"] = stats["escalacoes"] / total if total else 0.0
+        return snapshot
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+
+# Camada HTTP compartilhada pelas ferramentas de extração
+HTTP_FETCHER = HttpFetcher()
+
+
+def scrape_search(site: str, url: str, limit: int = PAGE_RESULT_LIMIT,
+                  html_content: Optional[str] = None) -> List[Dict]:
+    """
+    Extrai os produtos de uma página de busca do marketplace.
+    `html_content` é o HTML já baixado pela camada HTTP; sem ele, a página é aberta no
+    Selenium (quando não está em cache). Falhas são levantadas como `ExtractionError`.
+    Função bloqueante: executada em thread pelo `ExtractionScheduler`.
+    """
+    extractor = SITE_REGISTRY[site]
+    print(f"[TOOL] 🔍 Extraindo dados de {extractor.name}: {url}")
+    
+    with TRACER.span("extracao.pagina", site=site, url=url, cache=False,
+                     origem="http" if html_content is not None else "selenium") as span:
+        try:
+            cached = PAGE_CACHE.get(url)
+            if cached is not None:
+                html_content, rows = cached
+                span.set(cache=True)
+                print(f"[CACHE] ⚡ Página em cache: {url}")
+            elif PAGE_CACHE.offline:
+                raise CacheMissError(f"Página não encontrada no cache (modo offline): {url}", site, url)
+            else:
+                if html_content is None:
+                    html_content = fetch_search_html(site, url)
+                    print(f"[TOOL] 📄 HTML capturado: {len(html_content)} caracteres")
+                rows = None
+        
+            if rows is None:
+                # Página nova, ou parseada por outra versão das regras: o cache guarda todos os
+                # produtos da página; sem cache, a varredura para no limite
+                parse_limit = None if PAGE_CACHE.enabled else limit
+                with EXTRACTION_PROFILER.profile():
+                    rows = [product.to_row() for product in parse_search_html(site, html_content, limit=parse_limit)]
+                if cached is None:
+                    # Páginas sem produtos (bloqueio, captcha) não entram no cache
+                    if rows:
+                        PAGE_CACHE.put(url, site, html_content, rows)
+                    elif HttpFetcher.escalation_reason(site, html_content) == "desafio":
+                        raise BlockedError(f"Página de desafio anti-bot em {extractor.name}", site, url)
+                else:
+                    PAGE_CACHE.update_products(url, rows)
+            # O HTML não é mais necessário: libera a página antes de montar a saída
+            html_content = cached = None
+        except ExtractionError:
+            raise
+        except Exception as e:
+            raise ExtractionError(f"Falha inesperada na extração: {e}", site, url) from e
+        
+        rows = rows[:limit]
+        span.set(produtos=len(rows))
+        if not rows:
+            print("[TOOL] ⚠️ Nenhum container de produto encontrado")
+        
+        for i, row in enumerate(rows, 1):
+            print(f"  > Produto {i}: {extractor.id_field} {row[extractor.id_field]}")
+            print(f"    ✅ {row['Nome do Produto'][:50]}... - R$ {row['Preço (R$)']}")
+        
+        return rows
+
+async def fetch_and_scrape(site: str, url: str, limit: int = PAGE_RESULT_LIMIT) -> List[Dict]:
+    """
+    Uma tentativa de extração: camada HTTP primeiro e, se ela escalar, o Selenium.
+    Tudo dentro de uma vaga do `ExtractionScheduler`; páginas válidas em cache não são baixadas.
+    """
+    async with EXTRACTION_SCHEDULER.slot(site):
+        html_content = None
+        if HTTP_FETCHER.enabled and not PAGE_CACHE.offline and not PAGE_CACHE.is_fresh(url):
+            await RATE_LIMITER.acquire(url)
+            html_content = await HTTP_FETCHER.fetch(site, url)
+        return await EXTRACTION_SCHEDULER.run_in_thread(scrape_search, site, url, limit, html_content)
+
+async def extract_search_products(site: str, url: str, limit: int = PAGE_RESULT_LIMIT) -> List[Dict]:
+    """
+    Extrai os produtos de uma página de busca sem passar pelo Runner (sem chamada ao LLM).
+
+    Falhas de navegação, de driver e bloqueios são repetidas com backoff exponencial
+    (fora da vaga do agendador); bloqueios seguidos pausam o marketplace pelo disjuntor.
+    """
+    attempt = 1
+    while True:
+        CIRCUIT_BREAKER.check(site, url)
+        try:
+            rows = await fetch_and_scrape(site, url, limit)
+        except ExtractionError as e:
+            CIRCUIT_BREAKER.record_failure(site, blocked=isinstance(e, BlockedError))
+            if not e.retryable or attempt >= RETRY_MAX_ATTEMPTS:
+                raise
+            delay = retry_delay(attempt)
+            print(f"[RETRY] 🔁 {e.kind}: nova tentativa {attempt + 1}/{RETRY_MAX_ATTEMPTS} em {delay:.1f}s ({url})")
+            TRACER.metric("extracao.nova_tentativa", delay, unit="s", site=site, tipo=e.kind, tentativa=attempt)
+            await asyncio.sleep(delay)
+            attempt += 1
+        else:
+            CIRCUIT_BREAKER.record_success(site)
+            return rows
+
+async def run_extraction_tool(site: str, url: str) -> str:
+    """
+    Saída das ferramentas dos agentes: a lista de produtos em JSON ou o erro tipado em JSON.
+    """
+    try:
+        rows = await extract_search_products(site, url)
+    except ExtractionError as e:
+        return json.dumps(e.to_payload(), ensure_ascii=False)
+    return json.dumps(rows, ensure_ascii=False)
+
+async def extract_amazon_search_data(url: str) -> str:
+    """
+    Extrai dados de produtos diretamente da página de busca da Amazon usando regex otimizado.
+    """
+    return await run_extraction_tool("amazon", url)
+
+async def extract_mercadolivre_search_data(url: str) -> str:
+    """
+    Extrai dados de produtos diretamente da página de busca do Mercado Livre usando seletores CSS 
+    baseados no scraper Scrapy funcional.
+    """
+    return await run_extraction_tool("mercadolivre", url)
+
+def csv_columns() -> List[str]:
+    """
+    Colunas do CSV de saída: campos comuns, o identificador de cada marketplace e,
+    por fim, o modelo do cartucho e o grupo do produto entre marketplaces.
+    """
+    columns = ["Nome do Produto", "Preço (R$)", "Avaliação (estrelas)", "URL", "Disponibilidade"]
+    return columns + [extractor.id_field for extractor in SITE_REGISTRY.values()] + ["Modelo", "Grupo"]
+
+class IncrementalCsvWriter:
+    """
+    Grava linhas de produto no CSV à medida que as páginas são extraídas.
+    """
+
+    def __init__(self, filename: str = OUTPUT_CSV):
+        self.filename = filename
+        self.rows_written = 0
+        self._file = open(filename, 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=csv_columns(), extrasaction='ignore')
+        self._writer.writeheader()
+
+    def write_rows(self, rows: List[Dict]):
+        with TRACER.span("csv.gravacao", arquivo=self.filename, linhas=len(rows)):
+            self._writer.writerows(rows)
+            self._file.flush()
+        self.rows_written += len(rows)
+
+    def close(self):
+        self._file.close()
+
+class NdjsonWriter:
+    """
+    Grava registros de produto em NDJSON (um objeto JSON por linha) à medida que chegam.
+    """
+
+    def __init__(self, filename: str = OUTPUT_NDJSON, append: bool = False):
+        self.filename = filename
+        self.rows_written = 0
+        self._file = open(filename, 'a' if append else 'w', encoding='utf-8')
+
+    def write_rows(self, rows: List[Dict]):
+        with TRACER.span("ndjson.gravacao", arquivo=self.filename, linhas=len(rows)):
+            self._file.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+            self._file.flush()
+        self.rows_written += len(rows)
+
+    def close(self):
+        self._file.close()
+
+def read_ndjson(filename: str) -> Iterator[Dict]:
+    """
+    Lê um arquivo NDJSON registro a registro.
+    """
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _spill_sorted_chunk(chunk: List[Dict], key, reverse: bool) -> str:
+    chunk.sort(key=key, reverse=reverse)
+    fd, path = tempfile.mkstemp(prefix="ordenacao_", suffix=".ndjson")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in chunk)
+    return path
+
+def external_sort(records: Iterable[Dict], key, reverse: bool = False,
+                  chunk_size: int = SORT_CHUNK_SIZE) -> Iterator[Dict]:
+    """
+    Ordena um fluxo de registros com memória limitada: blocos de `chunk_size` registros
+    são ordenados e despejados em arquivos NDJSON temporários, depois intercalados com
+    `heapq.merge`. A ordenação é estável, como `list.sort`.
+    """
+    records = iter(records)
+    chunk_size = max(1, chunk_size)
+    paths = []
+    streams = []
+    try:
+        chunk = list(islice(records, chunk_size))
+        while len(chunk) == chunk_size:
+            paths.append(_spill_sorted_chunk(chunk, key, reverse))
+            chunk = list(islice(records, chunk_size))
+        if not paths:
+            # Coube em um único bloco: ordena em memória
+            chunk.sort(key=key, reverse=reverse)
+            yield from chunk
+            return
+        if chunk:
+            paths.append(_spill_sorted_chunk(chunk, key, reverse))
+        del chunk
+        streams = [read_ndjson(path) for path in paths]
+        yield from heapq.merge(*streams, key=key, reverse=reverse)
+    finally:
+        for stream in streams:
+            stream.close()
+        for path in paths:
+            os.remove(path)
+
+def _batches(records: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    records = iter(records)
+    batch = list(islice(records, size))
+    while batch:
+        yield batch
+        batch = list(islice(records, size))
+
+def write_sorted_csv(ndjson_path: str = OUTPUT_NDJSON, filename: str = OUTPUT_CSV) -> str:
+    """
+    Gera o CSV final a partir do NDJSON de produtos, ordenado por preço (decrescente),
+    em fluxo: a memória usada não depende do tamanho do crawl. O arquivo é gravado em
+    um temporário e substitui o CSV anterior só ao final.
+    """
+    print(f"\n[TOOL] 💾 Gravando dados ordenados no arquivo: {filename}")
+    
+    temp_filename = filename + ".tmp"
+    writer = IncrementalCsvWriter(temp_filename)
+    try:
+        records = external_sort(read_ndjson(ndjson_path),
+                                key=lambda row: row.get('Preço (R$)', 0), reverse=True)
+        for batch in _batches(records, 1000):
+            writer.write_rows(batch)
+    finally:
+        writer.close()
+    
+    if not writer.rows_written:
+        os.remove(temp_filename)
+        return "A lista de dados estava vazia. Arquivo CSV não gerado."
+    os.replace(temp_filename, filename)
+    return f"Dados de {writer.rows_written} produtos salvos com sucesso em {filename}."
+
+def ndjson_to_csv_tool(ndjson_path: str = OUTPUT_NDJSON, filename: str = OUTPUT_CSV) -> str:
+    """
+    Converte o arquivo NDJSON de produtos em CSV ordenado por preço (decrescente).
+    """
+    if not os.path.exists(ndjson_path):
+        return f"Erro: Arquivo NDJSON não encontrado: {ndjson_path}"
+    return write_sorted_csv(ndjson_path, filename)
+
+def site_of_row(row: Dict) -> Optional[str]:
+    """
+    Identifica o marketplace de uma linha de produto pela coluna de identificador presente.
+    """
+    for key, extractor in SITE_REGISTRY.items():
+        if row.get(extractor.id_field) not in (None, ""):
+            return key
+    return None
+
+def product_key(row: Dict) -> str:
+    """
+    Chave estável do produto: `site:ASIN` / `site:MLB_ID`. Sem ID, usa o link real do
+    produto e, sem link (a URL montada com "N/A" é igual para todos), um hash do
+    marketplace com o título normalizado.
+    """
+    site = site_of_row(row) or "desconhecido"
+    extractor = SITE_REGISTRY.get(site)
+    product_id = row.get(extractor.id_field) if extractor else None
+    if product_id and product_id != "N/A":
+        return f"{site}:{product_id}"
+    url = row.get("URL") or ""
+    if url and (extractor is None or url != extractor.url_template.format(id="N/A")):
+        return f"{site}:url:{url}"
+    digest = hashlib.sha1(f"{site}|{normalize_title(row.get('Nome do Produto', ''))}".encode()).hexdigest()[:16]
+    return f"{site}:titulo:{digest}"
+
+class ProductStore:
+    """
+    Armazenamento incremental em SQLite: um registro por produto (upsert por ASIN/MLB_ID)
+    e uma linha do tempo de preços com uma observação por produto em cada execução.
+    """
+
+    def __init__(self, path: str = PRODUCT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    started_at TEXT NOT NULL,
+                    finished_at TEXT
+                );
+                CREATE TABLE IF NOT EXISTS products (
+                    product_key TEXT PRIMARY KEY,
+                    site TEXT NOT NULL,
+                    product_id TEXT,
+                    title TEXT,
+                    url TEXT,
+                    rating REAL,
+                    last_price REAL,
+                    last_availability TEXT,
+                    min_price REAL,
+                    first_seen TEXT NOT NULL,
+                    last_seen TEXT NOT NULL,
+                    model_code TEXT
+                );
+                CREATE TABLE IF NOT EXISTS price_history (
+                    product_key TEXT NOT NULL,
+                    run_id INTEGER NOT NULL,
+                    observed_at TEXT NOT NULL,
+                    price REAL,
+                    availability TEXT,
+                    match_group INTEGER,
+                    PRIMARY KEY (product_key, run_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_history_run ON price_history (run_id, price);
+                """
+            )
+            # Históricos criados antes das colunas de modelo e grupo do ProductMatcher
+            for table, column, kind in (("products", "model_code", "TEXT"),
+                                        ("price_history", "match_group", "INTEGER")):
+                columns = {info[1] for info in self._conn.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+            self._conn.commit()
+        return self._conn
+
+    def start_run(self) -> int:
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute("INSERT INTO runs (started_at) VALUES (?)", (_now_iso(),))
+            conn.commit()
+            return cursor.lastrowid
+
+    def finish_run(self, run_id: int):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (_now_iso(), run_id))
+            conn.commit()
+
+    def upsert_rows(self, rows: List[Dict], run_id: int) -> int:
+        """
+        Insere ou atualiza os produtos e registra o preço observado nesta execução,
+        com o `Modelo` e o `Grupo` anotados por `dedup_records` (o grupo vale só na execução).
+        """
+        now = _now_iso()
+        products = []
+        history = []
+        for row in rows:
+            key = product_key(row)
+            site = site_of_row(row) or "desconhecido"
+            price = row.get("Preço (R$)")
+            availability = row.get("Disponibilidade")
+            product_id = row.get(SITE_REGISTRY[site].id_field) if site in SITE_REGISTRY else None
+            products.append((key, site, product_id, row.get("Nome do Produto"), row.get("URL"),
+                             row.get("Avaliação (estrelas)"), price, availability,
+                             price if price else None, now, now, row.get("Modelo") or None))
+            history.append((key, run_id, now, price, availability, row.get("Grupo")))
+        
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                """
+                INSERT INTO products (product_key, site, product_id, title, url, rating, last_price,
+                                      last_availability, min_price, first_seen, last_seen, model_code)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (product_key) DO UPDATE SET
+                    title = excluded.title,
+                    url = excluded.url,
+                    rating = excluded.rating,
+                    last_price = excluded.last_price,
+                    last_availability = excluded.last_availability,
+                    min_price = CASE
+                        WHEN excluded.min_price IS NULL THEN products.min_price
+                        WHEN products.min_price IS NULL THEN excluded.min_price
+                        ELSE MIN(products.min_price, excluded.min_price)
+                    END,
+                    last_seen = excluded.last_seen,
+                    model_code = COALESCE(excluded.model_code, products.model_code)
+                """,
+                products,
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO price_history (product_key, run_id, observed_at, price, availability, "
+                "match_group) VALUES (?, ?, ?, ?, ?, ?)",
+                history,
+            )
+            conn.commit()
+        return len(rows)
+
+    def latest_prices(self) -> Dict[str, tuple]:
+        """
+        `(último preço, menor preço, disponibilidade)` de cada produto conhecido, por chave.
+        Chamado antes de `upsert_rows`, reflete o estado deixado pelas execuções anteriores.
+        Se a última observação não tinha preço, o último preço é o da observação com preço mais recente.
+        """
+        with self._lock:
+            rows = self._connection().execute(
+                """
+                SELECT p.product_key,
+                       CASE WHEN p.last_price > 0 THEN p.last_price ELSE (
+                           SELECT h.price FROM price_history h
+                           WHERE h.product_key = p.product_key AND h.price > 0
+                           ORDER BY h.run_id DESC LIMIT 1
+                       ) END,
+                       p.min_price, p.last_availability
+                FROM products p
+                """
+            ).fetchall()
+        return {key: (last_price, min_price, availability) for key, last_price, min_price, availability in rows}
+
+    def price_timeline(self, key: str) -> List[Dict]:
+        """
+        Histórico de preços de um produto, da observação mais antiga para a mais recente.
+        """
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT observed_at, price, availability FROM price_history "
+                "WHERE product_key = ? ORDER BY run_id", (key,)
+            ).fetchall()
+        return [{"observed_at": at, "price": price, "availability": availability}
+                for at, price, availability in rows]
+
+    def run_summary(self, run_id: int, top: int = 5) -> Dict:
+        """
+        Estatísticas dos produtos observados em uma execução, via consultas indexadas por run_id.
+        """
+        with self._lock:
+            conn = self._connection()
+            count, avg_price, min_price, max_price, avg_rating = conn.execute(
+                """
+                SELECT COUNT(*), AVG(h.price), MIN(h.price), MAX(h.price), AVG(p.rating)
+                FROM price_history h JOIN products p ON p.product_key = h.product_key
+                WHERE h.run_id = ?
+                """,
+                (run_id,),
+            ).fetchone()
+            top_rows = conn.execute(
+                """
+                SELECT p.title, h.price, p.rating
+                FROM price_history h JOIN products p ON p.product_key = h.product_key
+                WHERE h.run_id = ? ORDER BY h.price DESC LIMIT ?
+                """,
+                (run_id, top),
+            ).fetchall()
+        return {
+            "total": count,
+            "preco_medio": avg_price or 0.0,
+            "preco_min": min_price or 0.0,
+            "preco_max": max_price or 0.0,
+            "avaliacao_media": avg_rating or 0.0,
+            "top": top_rows,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def _now_iso() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+# Armazenamento compartilhado do histórico de produtos
+PRODUCT_STORE = ProductStore()
+
+
+class PriceAlert:
+    """
+    Alerta de preço de um produto: `queda`, `novo_minimo` ou `disponibilidade`.
+    """
+    __slots__ = ("kind", "product_key", "title", "price", "previous", "url", "detail")
+
+    def __init__(self, kind: str, product_key: str, title: str, price, previous, url: str, detail: str):
+        self.kind = kind
+        self.product_key = product_key
+        self.title = title
+        self.price = price
+        self.previous = previous
+        self.url = url
+        self.detail = detail
+
+    def to_dict(self) -> Dict:
+        return {
+            "tipo": self.kind,
+            "produto": self.product_key,
+            "titulo": self.title,
+            "preco": self.price,
+            "anterior": self.previous,
+            "url": self.url,
+            "detalhe": self.detail,
+            "em": _now_iso(),
+        }
+
+
+class PriceAlertEngine:
+    """
+    Compara cada produto extraído com o último estado conhecido dele, assim que a página
+    chega, em O(1) por registro: um dicionário por chave (`site:ASIN` / `site:MLB_ID`)
+    com último preço, menor preço e disponibilidade, carregado do histórico no início
+    da execução e atualizado a cada registro.
+
+    Dispara alertas de queda (a partir de `drop_abs` reais ou `drop_pct` por cento),
+    de novo menor preço e de mudança de disponibilidade. Com `models`, só acompanha
+    os modelos cujo código começa por um deles (ex.: "664" inclui "664XL").
+    """
+
+    def __init__(self, index: Dict[str, tuple], drop_abs: float = ALERT_DROP_ABS,
+                 drop_pct: float = ALERT_DROP_PCT, models: Optional[List[str]] = None,
+                 filename: Optional[str] = ALERT_FILE):
+        self._index = index
+        self.drop_abs = drop_abs
+        self.drop_pct = drop_pct
+        self.models = tuple(ALERT_MODELS if models is None else models)
+        self.filename = filename
+        self._file = None
+        self.counts: Dict[str, int] = {}
+
+    @classmethod
+    def from_store(cls, store: "ProductStore", **kwargs) -> "PriceAlertEngine":
+        return cls(store.latest_prices(), **kwargs)
+
+    def check(self, row: Dict) -> List[PriceAlert]:
+        """
+        Avalia um registro, atualiza o índice e devolve os alertas disparados.
+        """
+        if self.models and not str(row.get("Modelo") or "").startswith(self.models):
+            return []
+        key = product_key(row)
+        if ":url:" in key or ":titulo:" in key:
+            # O índice de alertas só acompanha produtos com ASIN/MLB_ID
+            return []
+        price = row.get("Preço (R$)") or 0.0
+        availability = row.get("Disponibilidade")
+        previous = self._index.get(key)
+        alerts = []
+        if previous is not None:
+            last_price, min_price, last_availability = previous
+            title = row.get("Nome do Produto", "")
+            url = row.get("URL", "")
+            if price > 0 and last_price:
+                drop = last_price - price
+                drop_pct = drop / last_price * 100
+                if drop > 0 and (drop >= self.drop_abs or drop_pct >= self.drop_pct):
+                    alerts.append(PriceAlert("queda", key, title, price, last_price, url,
+                                             f"-R$ {drop:.2f} ({drop_pct:.1f}%)"))
+            if price > 0 and min_price and price < min_price:
+                alerts.append(PriceAlert("novo_minimo", key, title, price, min_price, url,
+                                         f"menor preço já visto (antes R$ {min_price:.2f})"))
+            if availability and last_availability and availability != last_availability:
+                alerts.append(PriceAlert("disponibilidade", key, title, price, last_price, url,
+                                         f"{last_availability} → {availability}"))
+        else:
+            last_price, min_price = None, None
+        if price > 0 and (not min_price or price < min_price):
+            min_price = price
+        # Indisponível (preço 0) não apaga o último preço: a próxima queda ainda é comparada com ele
+        self._index[key] = (price if price > 0 else last_price, min_price, availability)
+        for alert in alerts:
+            self._emit(alert)
+        return alerts
+
+    def _emit(self, alert: PriceAlert):
+        self.counts[alert.kind] = self.counts.get(alert.kind, 0) + 1
+        print(f"[ALERTA] 🔔 {alert.kind}: {alert.title[:50]} | R$ {alert.price} | {alert.detail}")
+        if self.filename:
+            if self._file is None:
+                self._file = open(self.filename, 'a', encoding='utf-8')
+            self._file.write(json.dumps(alert.to_dict(), ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+# -----------------------------------------------------------
+# Deduplicação e pareamento de produtos entre marketplaces
+# -----------------------------------------------------------
+
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+# Códigos de peça HP (ex.: F6V31AB, CZ103AB)
+_PART_NUMBER_RE = re.compile(r'\b([a-z]{1,2}[0-9][a-z0-9]{2,4}a[bl])\b')
+# Modelo do cartucho (ex.: 664, 664XL, 662 XL), ignorando volumes como "8 ml"
+_MODEL_CODE_RE = re.compile(r'\b([0-9]{2,3})(?:\s?(xl))?\b(?!\s?ml)')
+_BLACK_WORDS = {"preto", "black", "negro"}
+_COLOR_WORDS = {"colorido", "colorida", "color", "tricolor", "colors"}
+_STOPWORDS = {"de", "da", "do", "para", "com", "e", "o", "a", "em", "original", "cartucho", "cartuchos", "tinta"}
+
+
+def normalize_title(title: str) -> str:
+    """
+    Título em minúsculas, sem acentos e sem pontuação, com espaços simples.
+    """
+    text = unicodedata.normalize("NFKD", title or "").encode("ascii", "ignore").decode("ascii").lower()
+    return _NON_ALNUM_RE.sub(" ", text).strip()
+
+
+def extract_model_codes(title: str) -> List[str]:
+    """
+    Códigos de modelo presentes no título: números de peça (F6V31AB) e séries (664, 664XL).
+    """
+    normalized = normalize_title(title)
+    codes = [part.upper() for part in _PART_NUMBER_RE.findall(normalized)]
+    for number, xl in _MODEL_CODE_RE.findall(normalized):
+        code = number + xl.upper()
+        if code not in codes:
+            codes.append(code)
+    return codes
+
+
+class _MatchEntry:
+    __slots__ = ("site", "tokens", "key", "parts", "models", "color", "group")
+
+    def __init__(self, site, tokens, parts, models, color, group):
+        self.site = site
+        self.tokens = tokens
+        self.key = " ".join(sorted(tokens))
+        self.parts = parts
+        self.models = models
+        self.color = color
+        self.group = group
+
+
+class MatchResult:
+    __slots__ = ("duplicate", "group", "model_code")
+
+    def __init__(self, duplicate: bool, group: int, model_code: str):
+        self.duplicate = duplicate
+        self.group = group
+        self.model_code = model_code
+
+
+class ProductMatcher:
+    """
+    Deduplicação aproximada e pareamento entre marketplaces, incremental.
+
+    Cada produto é comparado apenas com os candidatos que compartilham um bloco
+    (número de peça ou modelo + XL), nunca com todos os anteriores. O mesmo ASIN/MLB_ID
+    no mesmo marketplace é sempre duplicata. Um candidato do mesmo marketplace acima de
+    `dedup_threshold` só é duplicata de um produto sem ID; com outro ID, é outra oferta
+    e entra no mesmo grupo. De outro marketplace, acima de `link_threshold`, também
+    entra no mesmo grupo de produto.
+    """
+
+    def __init__(self, dedup_threshold: float = MATCH_DEDUP_THRESHOLD,
+                 link_threshold: float = MATCH_LINK_THRESHOLD):
+        self.dedup_threshold = dedup_threshold
+        self.link_threshold = link_threshold
+        self._blocks: Dict[str, List[_MatchEntry]] = {}
+        self._next_group = 1
+        # Grupo de cada (marketplace, ASIN/MLB_ID) já visto
+        self._ids: Dict[tuple, int] = {}
+        self.comparisons = 0
+
+    @staticmethod
+    def _color(tokens) -> str:
+        black = bool(tokens & _BLACK_WORDS)
+        color = bool(tokens & _COLOR_WORDS)
+        return "KC" if black and color else "K" if black else "C" if color else ""
+
+    def _score(self, entry: _MatchEntry, other: _MatchEntry) -> float:
+        # Cores diferentes ou conjuntos de modelos disjuntos nunca são o mesmo produto
+        if entry.color and other.color and entry.color != other.color:
+            return 0.0
+        if entry.models and other.models and not (entry.models & other.models):
+            return 0.0
+        if entry.parts and entry.parts & other.parts:
+            return 1.0
+        matcher = SequenceMatcher(None, entry.key, other.key)
+        if matcher.real_quick_ratio() < self.link_threshold or matcher.quick_ratio() < self.link_threshold:
+            return 0.0
+        return matcher.ratio()
+
+    def add(self, title: str, site: str, product_id: Optional[str] = None) -> MatchResult:
+        normalized = normalize_title(title)
+        codes = extract_model_codes(title)
+        parts = {code for code in codes if not code.isdigit() and not code[:-2].isdigit()}
+        models = set(codes) - parts
+        # Série do cartucho (664XL) tem preferência sobre o número de peça
+        series = [code for code in codes if code in models]
+        model_code = (series or codes or [""])[0]
+        if product_id and (site, product_id) in self._ids:
+            return MatchResult(True, self._ids[(site, product_id)], model_code)
+        
+        tokens = {token for token in normalized.split() if token not in _STOPWORDS}
+        entry = _MatchEntry(site, tokens, parts, models, self._color(tokens), 0)
+        
+        blocks = [f"pn:{part}" for part in parts] + [f"mod:{model}" for model in models]
+        if not blocks:
+            blocks = [f"txt:{entry.key[:24]}"]
+        
+        best_same, best_other = None, None
+        seen = set()
+        for block in blocks:
+            for candidate in self._blocks.get(block, ()):
+                if id(candidate) in seen:
+                    continue
+                seen.add(id(candidate))
+                self.comparisons += 1
+                score = self._score(entry, candidate)
+                if candidate.site == site:
+                    if score >= self.dedup_threshold and (best_same is None or score > best_same[0]):
+                        best_same = (score, candidate)
+                elif score >= self.link_threshold and (best_other is None or score > best_other[0]):
+                    best_other = (score, candidate)
+        
+        if best_same is not None and not product_id:
+            return MatchResult(True, best_same[1].group, model_code)
+        
+        # Outro anúncio do mesmo produto no mesmo marketplace (outro ID) fica, no mesmo grupo
+        if best_same is not None:
+            entry.group = best_same[1].group
+        elif best_other is not None:
+            entry.group = best_other[1].group
+        else:
+            entry.group = self._next_group
+            self._next_group += 1
+        if product_id:
+            self._ids[(site, product_id)] = entry.group
+        for block in blocks:
+            self._blocks.setdefault(block, []).append(entry)
+        return MatchResult(False, entry.group, model_code)
+
+def dedup_records(records: Iterable[Dict], site: str, matcher: ProductMatcher) -> Iterator[Dict]:
+    """
+    Etapa de deduplicação do fluxo de registros: descarta títulos curtos, IDs repetidos e
+    duplicatas aproximadas sem ASIN/MLB_ID e anota o modelo e o grupo de cada produto mantido.
+    """
+    extractor = SITE_REGISTRY.get(site)
+    for product in records:
+        name = product.get('Nome do Produto', '').strip()
+        if len(name) <= 5:
+            continue
+        product_id = product.get(extractor.id_field) if extractor else None
+        match = matcher.add(name, site, product_id if product_id != "N/A" else None)
+        if match.duplicate:
+            continue
+        product["Modelo"] = match.model_code
+        product["Grupo"] = match.group
+        yield product
+
+# -----------------------------------------------------------
+# Relatório de preços sobre o histórico (pandas, operações vetorizadas)
+# -----------------------------------------------------------
 
-# Importações do Agents SDK
-from agents import Agent, Runner, function_tool, set_default_openai_key
-import pandas as pd
-from dotenv import load_dotenv
+# Volume do cartucho no título (ex.: "8ml", "8,5 ml")
+_VOLUME_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s?ml\b')
+# Quantidade de cartuchos no anúncio (ex.: "kit 2", "kit com 3", "2 unidades", "2 cartuchos")
+_UNITS_RE = re.compile(r'\b(?:kit|combo|pack)\s(?:com\s)?(\d{1,2})\b|\b(\d{1,2})\s(?:unidades|un|cartuchos)\b')
+
+
+def _title_features(titles):
+    """
+    Modelo, número de peça, volume (ml) e quantidade de cartuchos de cada título distinto.
+    Recebe e devolve dados indexados pelas categorias dos títulos (cada título é processado uma vez).
+    """
+    import pandas as pd
+    
+    lowered = titles.str.lower()
+    normalized = (titles.str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+                  .str.lower().str.replace(_NON_ALNUM_RE.pattern, " ", regex=True).str.strip())
+    # Série do cartucho (664XL) tem preferência sobre o número de peça, como no ProductMatcher
+    series = normalized.str.extract(_MODEL_CODE_RE)
+    parts = normalized.str.extract(_PART_NUMBER_RE)[0].str.upper()
+    model_code = (series[0] + series[1].fillna("").str.upper()).fillna(parts).fillna("")
+    
+    volume = pd.to_numeric(lowered.str.extract(_VOLUME_RE)[0].str.replace(",", ".", regex=False),
+                           errors="coerce").astype("float32")
+    units = lowered.str.extract(_UNITS_RE)
+    units = pd.to_numeric(units[0].fillna(units[1]), errors="coerce").fillna(1).clip(lower=1).astype("int16")
+    return pd.DataFrame({"model_code": model_code, "part_number": parts, "ml": volume, "unidades": units})
+
+
+def load_price_history(store_path: str = PRODUCT_STORE_PATH):
+    """
+    Observações de preço do histórico (uma linha por produto e execução) em um DataFrame
+    tipado: colunas categóricas para site, produto, título e modelo e float32 para preços.
+    O modelo gravado pelo ProductMatcher tem preferência sobre o extraído do título.
+    """
+    import pandas as pd
+    
+    conn = sqlite3.connect(f"file:{store_path}?mode=ro", uri=True)
+    try:
+        # Históricos anteriores às colunas de modelo e grupo são lidos sem elas
+        product_columns = {info[1] for info in conn.execute("PRAGMA table_info(products)")}
+        history_columns = {info[1] for info in conn.execute("PRAGMA table_info(price_history)")}
+        stored_model = "p.model_code" if "model_code" in product_columns else "NULL"
+        match_group = "h.match_group" if "match_group" in history_columns else "NULL"
+        history = pd.read_sql_query(
+            f"""
+            SELECT h.run_id, h.product_key, p.site, p.title, h.price, h.availability,
+                   {stored_model} AS stored_model, {match_group} AS match_group
+            FROM price_history h JOIN products p ON p.product_key = h.product_key
+            """,
+            conn,
+        )
+    finally:
+        conn.close()
+    
+    history = history.astype({
+        "run_id": "int32",
+        "product_key": "category",
+        "site": "category",
+        "title": "category",
+        "availability": "category",
+        "price": "float32",
+        "match_group": "Int32",
+    })
+    titles = history["title"].cat.categories.to_series(index=range(len(history["title"].cat.categories)))
+    features = _title_features(titles.astype(str))
+    codes = history["title"].cat.codes.to_numpy()
+    stored_model = history.pop("stored_model")
+    history["model_code"] = pd.Categorical(
+        stored_model.where(stored_model.fillna("") != "", features["model_code"].to_numpy()[codes]))
+    history["part_number"] = pd.Categorical(features["part_number"].to_numpy()[codes])
+    history["ml"] = features["ml"].to_numpy()[codes]
+    history["unidades"] = features["unidades"].to_numpy()[codes]
+    history["preco_unidade"] = (history["price"] / history["unidades"]).astype("float32")
+    history["preco_ml"] = (history["price"] / (history["ml"] * history["unidades"])).astype("float32")
+    return history
+
+
+def model_price_distribution(snapshot):
+    """
+    Distribuição de preços por modelo de cartucho: quantidade, mínimo, quartis, média, máximo e desvio.
+    """
+    import pandas as pd
+    
+    priced = snapshot[snapshot["model_code"] != ""]
+    if priced.empty:
+        return pd.DataFrame(columns=["count", "min", "p25", "median", "p75", "mean", "max", "std"])
+    grouped = priced.groupby("model_code", observed=True)["price"]
+    distribution = grouped.agg(["count", "min", "median", "mean", "max", "std"])
+    quartiles = grouped.quantile([0.25, 0.75]).unstack().reindex(columns=[0.25, 0.75])
+    distribution.insert(2, "p25", quartiles[0.25])
+    distribution.insert(4, "p75", quartiles[0.75])
+    return distribution.sort_values("count", ascending=False)
+
+
+def cheapest_offers(snapshot):
+    """
+    Oferta mais barata de cada SKU em cada marketplace. O SKU é o número de peça do título
+    (F6V29AB); anúncios sem ele herdam o de outro produto do mesmo `Grupo` ou ficam com o grupo,
+    e observações sem grupo ficam com o modelo (664XL).
+    """
+    columns = ["sku", "model_code", "site", "price", "preco_unidade", "product_key", "title"]
+    priced = snapshot[snapshot["model_code"] != ""]
+    if priced.empty:
+        return priced.reindex(columns=columns).reset_index(drop=True)
+    part = priced["part_number"].astype(object)
+    group = priced["match_group"]
+    group_part = part.groupby(group).transform("first")
+    group_label = ("grupo " + group.astype(str)).where(group.notna())
+    sku = part.fillna(group_part).fillna(group_label).fillna(priced["model_code"].astype(str))
+    priced = priced.assign(sku=sku)
+    index = priced.groupby(["sku", "site"], observed=True)["price"].idxmin()
+    return priced.loc[index, columns].sort_values(["model_code", "sku", "price"]).reset_index(drop=True)
+
+
+def price_per_volume(snapshot):
+    """
+    Preço por unidade e por ml, por modelo, nos anúncios cujo título informa o volume.
+    """
+    import pandas as pd
+    
+    with_volume = snapshot[(snapshot["model_code"] != "") & snapshot["preco_ml"].notna()]
+    if with_volume.empty:
+        return pd.DataFrame(columns=["anuncios", "preco_unidade_min", "preco_ml_min", "preco_ml_mediana"])
+    return (with_volume.groupby("model_code", observed=True)
+            .agg(anuncios=("price", "size"),
+                 preco_unidade_min=("preco_unidade", "min"),
+                 preco_ml_min=("preco_ml", "min"),
+                 preco_ml_mediana=("preco_ml", "median"))
+            .sort_values("preco_ml_min"))
 
-# Carrega as variáveis de ambiente do arquivo .env
-load_dotenv()
+
+def run_deltas(history, run_id: int):
+    """
+    Variação de preço de cada produto da execução `run_id` em relação à observação anterior dele.
+    """
+    columns = ["model_code", "site", "preco_anterior", "price", "variacao", "variacao_pct", "product_key", "title"]
+    priced = history[history["price"] > 0].sort_values(["product_key", "run_id"])
+    if priced.empty:
+        return priced.reindex(columns=columns).reset_index(drop=True)
+    previous = priced.groupby("product_key", observed=True)["price"].shift()
+    deltas = priced.assign(preco_anterior=previous, variacao=priced["price"] - previous)
+    deltas = deltas[(deltas["run_id"] == run_id) & deltas["preco_anterior"].notna()]
+    deltas = deltas.assign(variacao_pct=(deltas["variacao"] / deltas["preco_anterior"] * 100).astype("float32"))
+    return deltas[columns].sort_values("variacao_pct").reset_index(drop=True)
+
+
+def build_price_report(store_path: str = PRODUCT_STORE_PATH, run_id: Optional[int] = None) -> Dict:
+    """
+    Relatório de preços de uma execução do histórico (a mais recente, por padrão):
+    distribuição por modelo, oferta mais barata por SKU e marketplace, preço por
+    unidade/ml e variação em relação às execuções anteriores. Devolve DataFrames.
+    """
+    if not os.path.exists(store_path):
+        return {"execucao": None}
+    history = load_price_history(store_path)
+    if history.empty:
+        return {"execucao": None}
+    run_id = int(history["run_id"].max()) if run_id is None else run_id
+    snapshot = history[(history["run_id"] == run_id) & (history["price"] > 0)]
+    return {
+        "execucao": run_id,
+        "distribuicao_modelo": model_price_distribution(snapshot),
+        "mais_barato": cheapest_offers(snapshot),
+        "preco_por_volume": price_per_volume(snapshot),
+        "variacao": run_deltas(history, run_id),
+    }
+
+
+def save_price_report(report: Dict, directory: str) -> List[str]:
+    """
+    Grava cada tabela do relatório em `<directory>/<tabela>.csv` e devolve os caminhos.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for key, frame in report.items():
+        if key == "execucao":
+            continue
+        path = os.path.join(directory, f"{key}.csv")
+        frame.to_csv(path, encoding='utf-8')
+        paths.append(path)
+    return paths
+
+def print_price_report(report: Dict, top: int = 10):
+    import pandas as pd
+    
+    if report["execucao"] is None:
+        print("❌ Histórico vazio: nenhuma execução registrada")
+        return
+    titles = {
+        "distribuicao_modelo": "📊 DISTRIBUIÇÃO DE PREÇOS POR MODELO",
+        "mais_barato": "🏷️ OFERTA MAIS BARATA POR SKU E MARKETPLACE",
+        "preco_por_volume": "🧪 PREÇO POR UNIDADE E POR ML",
+        "variacao": "📉 VARIAÇÃO EM RELAÇÃO À EXECUÇÃO ANTERIOR (maiores quedas primeiro)",
+    }
+    print(f"📋 RELATÓRIO DE PREÇOS (execução #{report['execucao']})")
+    with pd.option_context("display.width", 160, "display.max_colwidth", 50, "display.float_format", "{:.2f}".format):
+        for key, title in titles.items():
+            frame = report[key]
+            print(f"\n{title}:")
+            print(frame.head(top).to_string() if not frame.empty else "   (sem dados)")
+
+def parse_tool_output(output: str) -> List[Dict]:
+    """
+    Converte a saída de uma ferramenta de extração em lista de produtos.
+    Erros tipados (`{"erro": {...}}`) e mensagens "ERRO ..." são levantados como `ExtractionError`.
+    """
+    output = output.strip()
+    if output.startswith("ERRO"):
+        raise ExtractionError(output)
+    try:
+        data = json.loads(output)
+    except json.JSONDecodeError:
+        raise InvalidOutputError(f"Saída da ferramenta não é JSON: {output[:80]}")
+    if isinstance(data, dict) and "erro" in data:
+        raise ExtractionError.from_payload(data)
+    if not isinstance(data, list):
+        raise InvalidOutputError(f"Saída da ferramenta não é uma lista de produtos: {output[:80]}")
+    return data
+
+async def run_agent(agent, input: str):
+    """
+    Executa o agente pelo Runner registrando a latência e o consumo de tokens em um span.
+    """
+    from agents import Runner
+    
+    with TRACER.span("llm.run", agente=agent.name, entrada_chars=len(input)) as span:
+        result = await Runner.run(agent, input=input)
+        usage = result.context_wrapper.usage
+        span.set(requisicoes=usage.requests, tokens_entrada=usage.input_tokens,
+                 tokens_saida=usage.output_tokens, tokens_total=usage.total_tokens)
+        return result
 
 # -----------------------------------------------------------
-# 1. CONFIGURAÇÃO DE AMBIENTE E MODELO
+# 3. DEFINIÇÃO DOS AGENTES
 # -----------------------------------------------------------
 
-# Configuração da Chave de API
-try:
-    OPENAI_KEY = os.getenv("OPENAI_API_KEY")
-    os.environ["OPENAI_API_KEY"] = OPENAI_KEY 
-    set_default_openai_key(key=OPENAI_KEY)
-    print("Chave de API configurada no Agents SDK.")
-except Exception:
-    print("AVISO: Chave de API não configurada corretamente.")
+def configure_openai_key():
+    """
+    Configura a chave de API no Agents SDK.
+    """
+    from agents import set_default_openai_key
+    
+    try:
+        os.environ["OPENAI_API_KEY"] = OPENAI_KEY 
+        set_default_openai_key(key=OPENAI_KEY)
+        print("Chave de API configurada no Agents SDK.")
+    except Exception:
+        print("AVISO: Chave de API não configurada corretamente.")
 
-MODEL_NAME = "gpt-4o-mini"
+# Agentes criados na primeira chamada de build_agents()
+_AGENTS: Dict[str, object] = {}
+
+def build_agents() -> Dict[str, object]:
+    """
+    Cria os agentes e suas ferramentas na primeira chamada e os reutiliza depois.
+    O Agents SDK só é importado aqui, então o modo direto e o offline não o carregam.
+    """
+    if _AGENTS:
+        return _AGENTS
+    from agents import Agent, function_tool
+    
+    configure_openai_key()
+    
+    # AGENTE AMAZON: Extrai dados da página de busca da Amazon
+    amazon_agent = Agent(
+        name="Agente Amazon Search",
+        model=MODEL_NAME, 
+        instructions="""
+        Use a ferramenta 'extract_amazon_search_data' para extrair dados de produtos diretamente da página de busca da Amazon.
+        Esta ferramenta já faz toda a extração usando regex otimizado.
+        Retorne APENAS o resultado da ferramenta, sem nenhum texto adicional.
+        O resultado já é um JSON válido de lista de produtos.
+        """,
+        tools=[function_tool(extract_amazon_search_data)], 
+        # A saída da ferramenta já é o resultado final: evita uma segunda chamada ao modelo
+        tool_use_behavior="stop_on_first_tool",
+    )
+
+    # AGENTE MERCADO LIVRE: Extrai dados da página de busca do Mercado Livre
+    mercadolivre_agent = Agent(
+        name="Agente Mercado Livre Search",
+        model=MODEL_NAME, 
+        instructions="""
+        Use a ferramenta 'extract_mercadolivre_search_data' para extrair dados de produtos diretamente da página de busca do Mercado Livre.
+        Esta ferramenta já faz toda a extração usando seletores CSS otimizados.
+        Retorne APENAS o resultado da ferramenta, sem nenhum texto adicional.
+        O resultado já é um JSON válido de lista de produtos.
+        """,
+        tools=[function_tool(extract_mercadolivre_search_data)], 
+        # A saída da ferramenta já é o resultado final: evita uma segunda chamada ao modelo
+        tool_use_behavior="stop_on_first_tool",
+    )
+
+    # AGENTE CONSOLIDADOR: Combina e salva dados
+    consolidator_agent = Agent(
+        name="Agente Consolidador",
+        model=MODEL_NAME, 
+        instructions="Receba o caminho do arquivo NDJSON com os produtos coletados e use a 'ndjson_to_csv_tool' para salvá-los em CSV.",
+        tools=[function_tool(ndjson_to_csv_tool)],
+    )
+
+    _AGENTS.update(
+        amazon_agent=amazon_agent,
+        mercadolivre_agent=mercadolivre_agent,
+        consolidator_agent=consolidator_agent,
+        # Agente responsável por cada marketplace no modo com LLM
+        SITE_AGENTS={
+            "amazon": amazon_agent,
+            "mercadolivre": mercadolivre_agent,
+        },
+    )
+    return _AGENTS
+
+def __getattr__(name: str):
+    # Mantém `agentsSDK.amazon_agent`, `agentsSDK.SITE_AGENTS` etc. acessíveis, criando os agentes sob demanda
+    if name in ("amazon_agent", "mercadolivre_agent", "consolidator_agent", "SITE_AGENTS"):
+        return build_agents()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # -----------------------------------------------------------
-# 2. DEFINIÇÃO DAS FERRAMENTAS (TOOLS)
+# 4. ORQUESTRAÇÃO PRINCIPAL
 # -----------------------------------------------------------
 
-def initialize_selenium_driver():
+
+class SearchQuery:
     """
-    Inicializa o driver do Chrome com configurações otimizadas.
+    Consulta de busca em um marketplace, com número de páginas e limite de produtos.
     """
-    try:
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-        
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        
-        # Remove propriedades que indicam automação
-        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        
-        return driver
-    except Exception as e:
-        return f"ERRO NO DRIVER: Falha ao inicializar o driver Selenium. Mensagem: {e}"
+    __slots__ = ("site", "query", "pages", "limit")
 
-@function_tool
-def extract_amazon_search_data(url: str) -> str:
+    def __init__(self, site: str, query: str, pages: int = 1, limit: int = PAGE_RESULT_LIMIT):
+        self.site = site
+        self.query = query
+        self.pages = max(1, pages)
+        self.limit = max(1, limit)
+
+
+class CrawlTask:
     """
-    Extrai dados de produtos diretamente da página de busca da Amazon usando regex otimizado.
+    Uma página de resultados de uma consulta, na fila de crawl. `query_index` é a posição
+    da consulta na lista do crawl; `last` indica que nenhuma outra página da consulta
+    será visitada depois desta.
+    """
+    __slots__ = ("search", "page", "query_index", "url", "last")
+
+    def __init__(self, search: SearchQuery, page: int, query_index: int = 0):
+        self.search = search
+        self.page = page
+        self.query_index = query_index
+        self.url = SITE_REGISTRY[search.site].build_search_url(search.query, page)
+        self.last = False
+
+
+# Consultas padrão (as mesmas buscas da versão original)
+DEFAULT_QUERIES = [
+    SearchQuery("amazon", "cartucho hp 664 original"),
+    SearchQuery("mercadolivre", "cartucho hp 662"),
+]
+
+
+async def crawl(queries: List[SearchQuery], fetch_page, concurrency: int = EXTRACTION_MAX_CONCURRENCY):
+    """
+    Percorre as páginas de cada consulta por uma fila de crawl e gera
+    `(task, produtos_ou_exceção)` à medida que as páginas terminam.
+
+    As páginas de uma mesma consulta são visitadas em sequência: a próxima só entra
+    na fila se a anterior trouxe produtos e o limite da consulta ainda não foi atingido.
+    Consultas diferentes rodam em paralelo, até `concurrency` páginas por vez.
+
+    Como a próxima página só é enfileirada depois que a anterior foi entregue, as páginas
+    de cada consulta saem em ordem; consultas diferentes se intercalam conforme terminam,
+    sem buffer de reordenação (a memória não cresce com o crawl e os alertas não esperam
+    pelas consultas mais lentas). O estado de cada consulta é indexado pela posição dela
+    na lista, então a mesma `SearchQuery` pode aparecer mais de uma vez.
     """
-    driver_or_error = initialize_selenium_driver()
+    pending: asyncio.Queue = asyncio.Queue()
+    finished: asyncio.Queue = asyncio.Queue()
+    remaining = [search.limit for search in queries]
+    done = object()
     
-    if isinstance(driver_or_error, str):
-        return driver_or_error 
+    for index, search in enumerate(queries):
+        pending.put_nowait(CrawlTask(search, 1, index))
     
-    driver = driver_or_error
-    print(f"[TOOL] 🔍 Extraindo dados da Amazon: {url}")
+    async def worker():
+        while True:
+            task = await pending.get()
+            try:
+                search, index = task.search, task.query_index
+                products = await fetch_page(task, remaining[index])
+                products = products[:remaining[index]]
+                remaining[index] -= len(products)
+                if products and remaining[index] > 0 and task.page < search.pages:
+                    pending.put_nowait(CrawlTask(search, task.page + 1, index))
+                else:
+                    task.last = True
+                await finished.put((task, products))
+            except Exception as e:
+                task.last = True
+                await finished.put((task, e))
+            finally:
+                pending.task_done()
+    
+    async def close_when_empty():
+        await pending.join()
+        await finished.put(done)
     
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    closer = asyncio.create_task(close_when_empty())
     try:
-        driver.get(url)
-        time.sleep(5)  # Aguarda carregamento
-        
-        html_content = driver.page_source
-        print(f"[TOOL] 📄 HTML capturado: {len(html_content)} caracteres")
-        
-        products = []
-        
-        # Regex para extrair contêineres de produto com data-asin
-        product_pattern = r'<div[^>]*data-asin="([A-Z0-9]{10})"[^>]*data-component-type="s-search-result"[^>]*>(.*?)</div>\s*</div>\s*</div>\s*</span>'
-        
-        matches = re.findall(product_pattern, html_content, re.DOTALL)
-        print(f"[TOOL] 🎯 {len(matches)} produtos encontrados")
-        
-        for i, (asin, product_html) in enumerate(matches[:10], 1):  # Limita a 10 produtos
-            print(f"  > Processando produto {i}: ASIN {asin}")
-            
-            # Extrai título
-            title_patterns = [
-                r'<h2[^>]*>(.*?)</h2>',
-                r'<span[^>]*class="[^"]*a-size-base-plus[^"]*"[^>]*>([^<]*)</span>',
-                r'title":{"text":"([^"]*)"'
-            ]
-            
-            title = "N/A"
-            for pattern in title_patterns:
-                title_match = re.search(pattern, product_html, re.DOTALL)
-                if title_match:
-                    title = re.sub(r'<[^>]+>', '', title_match.group(1)).strip()
-                    if title and len(title) > 10:  # Título válido
-                        break
-            
-            # Extrai preço
-            price = 0.0
-            price_patterns = [
-                r'<span class="a-price-whole">([0-9,]+)</span><span class="a-price-fraction">([0-9]{2})</span>',
-                r'R\$\s*([0-9,]+[.,][0-9]{2})',
-                r'"price":([0-9.]+)'
-            ]
-            
-            for pattern in price_patterns:
-                price_match = re.search(pattern, product_html)
-                if price_match:
-                    if len(price_match.groups()) == 2:  # Padrão whole/fraction
-                        whole, fraction = price_match.groups()
-                        price = float(whole.replace(',', '') + '.' + fraction)
-                    else:  # Padrão único
-                        price_str = price_match.group(1).replace(',', '.')
-                        price = float(price_str)
-                    break
-            
-            # Extrai avaliação
-            rating = 0.0
-            rating_patterns = [
-                r'aria-hidden="true" class="a-size-small a-color-base">([0-9,]+)</span>',
-                r'"rating_average":([0-9.]+)',
-                r'([0-9,]+) de 5 estrelas'
-            ]
-            
-            for pattern in rating_patterns:
-                rating_match = re.search(pattern, product_html)
-                if rating_match:
-                    rating_str = rating_match.group(1).replace(',', '.')
-                    rating = float(rating_str)
-                    break
-            
-            # URL do produto
-            product_url = f"https://www.amazon.com.br/dp/{asin}"
-            
-            # Disponibilidade (assume em estoque se tem preço)
-            availability = "Em estoque" if price > 0 else "Indisponível"
-            
-            product_data = {
-                "Nome do Produto": title,
-                "Preço (R$)": price,
-                "Avaliação (estrelas)": rating,
-                "URL": product_url,
-                "Disponibilidade": availability,
-                "ASIN": asin
-            }
-            
-            products.append(product_data)
-            print(f"    ✅ {title[:50]}... - R$ {price}")
-        
-        return json.dumps(products, ensure_ascii=False)
-        
-    except Exception as e:
-        return f"ERRO: {e}"
-        
+        while True:
+            item = await finished.get()
+            if item is done:
+                break
+            yield item
     finally:
-        if driver:
-            try:
-                driver.quit()
-            except:
-                pass
+        for task in workers + [closer]:
+            task.cancel()
+        await asyncio.gather(*workers, closer, return_exceptions=True)
+
 
-@function_tool
-def extract_mercadolivre_search_data(url: str) -> str:
+def print_run_summary(run_id: int):
     """
-    Extrai dados de produtos diretamente da página de busca do Mercado Livre usando seletores CSS 
-    baseados no scraper Scrapy funcional.
+    Resumo de uma execução a partir de consultas indexadas no histórico, sem reler o CSV.
     """
-    driver_or_error = initialize_selenium_driver()
+    summary = PRODUCT_STORE.run_summary(run_id)
+    print(f"\n📊 RESUMO DOS DADOS COLETADOS (execução #{run_id}):")
+    print(f"   • Total de produtos: {summary['total']}")
+    print(f"   • Preço médio: R$ {summary['preco_medio']:.2f}")
+    print(f"   • Preço mínimo: R$ {summary['preco_min']:.2f}")
+    print(f"   • Preço máximo: R$ {summary['preco_max']:.2f}")
+    print(f"   • Avaliação média: {summary['avaliacao_media']:.1f} estrelas")
+
+    print(f"\n🏆 TOP 5 PRODUTOS POR PREÇO:")
+    for i, (name, price, rating) in enumerate(summary['top'], 1):
+        print(f"   {i}. {name[:50]}... - R$ {price} ({rating}⭐)")
+    print("\n   Relatório completo (modelos, ofertas, preço por ml, variações): python agentsSDK.py relatorio")
+
+
+async def main(direct: bool = False, queries: Optional[List[SearchQuery]] = None,
+               offline: bool = False, use_cache: bool = True, use_http: bool = HTTP_FETCH_ENABLED):
+    """
+    Executa o pipeline completo. Com `direct=True`, extração e gravação do CSV
+    chamam as funções diretamente, sem rodadas de LLM. Com `offline=True`, as
+    páginas vêm apenas do cache em disco, sem abrir o navegador. Com `use_http=True`,
+    cada página é tentada primeiro por HTTP e só vai ao Selenium se for preciso.
+    """
+    print("🚀 INÍCIO DO SCRAPING DE CARTUCHOS HP - PÁGINAS DE BUSCA")
+    print("="*60)
+    if direct:
+        print("[FLUXO] ⚡ Modo direto: agentes desativados")
     
-    if isinstance(driver_or_error, str):
-        return driver_or_error 
+    queries = queries or DEFAULT_QUERIES
+    PAGE_CACHE.enabled = use_cache or offline
+    PAGE_CACHE.offline = offline
+    HTTP_FETCHER.enabled = use_http and not offline
     
-    driver = driver_or_error
-    print(f"[TOOL] 🔍 Extraindo dados do Mercado Livre: {url}")
+    if offline:
+        print("[FLUXO] 📦 Modo offline: usando apenas páginas em cache")
+    elif HTTP_FETCHER.enabled:
+        # Os drivers só são criados se alguma página precisar escalar para o Selenium
+        print("[FLUXO] 🌐 Camada HTTP ativa: Selenium apenas como fallback")
+    else:
+        # Pré-aquece o pool para que a primeira extração não pague a inicialização do Chrome
+        DRIVER_POOL.warm_up()
     
     try:
-        driver.get(url)
-        time.sleep(5)  # Aguarda carregamento
+        with TRACER.span("pipeline", modo="direto" if direct else "agentes",
+                         consultas=len(queries), offline=offline):
+            failures: Dict[str, int] = {}
         
-        html_content = driver.page_source
-        print(f"[TOOL] 📄 HTML capturado: {len(html_content)} caracteres")
+            async def fetch_page(task: CrawlTask, limit: int) -> List[Dict]:
+                if direct:
+                    return await extract_search_products(task.search.site, task.url, limit)
+                result = await run_agent(
+                    build_agents()["SITE_AGENTS"][task.search.site], 
+                    input=f"Extraia todos os dados de produtos desta URL: {task.url}"
+                )
+                return parse_tool_output(result.final_output)
         
-        products = []
-        
-        # Usa os mesmos seletores CSS que funcionam no scraper Scrapy
-        # Busca por containers de produto
-        container_patterns = [
-            r'<li[^>]*class="[^"]*ui-search-layout__item[^"]*"[^>]*>(.*?)</li>',
-            r'<div[^>]*class="[^"]*andes-card[^"]*poly-card[^"]*"[^>]*>(.*?)</div>'
-        ]
-        
-        containers = []
-        for pattern in container_patterns:
-            matches = re.findall(pattern, html_content, re.DOTALL)
-            if matches:
-                containers = matches
-                print(f"[TOOL] � {len(containers)} containers encontrados com padrão: {pattern[:50]}...")
-                break
+            # ETAPA 1: EXTRAÇÃO DE DADOS DAS PÁGINAS DE BUSCA
+            print(f"\n[FLUXO] 📊 Extraindo dados de {len(queries)} consultas de busca...")
         
-        if not containers:
-            print("[TOOL] ⚠️ Nenhum container de produto encontrado")
-            return json.dumps([])
-        
-        # Limita a 10 produtos
-        for i, container_html in enumerate(containers[:10], 1):
-            print(f"  > Processando container {i}")
-            
-            # Extrai título usando padrões mais robustos
-            title = "N/A"
-            title_patterns = [
-                # Padrões mais específicos primeiro
-                r'<h2[^>]*class="[^"]*ui-search-item__title[^"]*"[^>]*>([^<]+)</h2>',
-                r'<a[^>]*class="[^"]*ui-search-item__group__element[^"]*"[^>]*title="([^"]+)"',
-                r'class="[^"]*ui-search-item__title[^"]*"[^>]*>([^<]+)<',
-                r'<span[^>]*class="[^"]*ui-search-item__title[^"]*"[^>]*>([^<]+)</span>',
-                r'<a[^>]*class="[^"]*poly-component__title[^"]*"[^>]*>([^<]+)</a>',
-                # Padrões mais genéricos
-                r'ui-search-item__title[^>]*>([^<]{10,})<',  # Título com pelo menos 10 caracteres
-                r'title="([^"]{10,})"[^>]*ui-search',  # Atributo title
-                r'<a[^>]*>([^<]{15,})</a>[^<]*cartucho|hp',  # Link com texto relacionado
-            ]
-            
-            for pattern in title_patterns:
-                title_match = re.search(pattern, container_html, re.IGNORECASE)
-                if title_match:
-                    title = title_match.group(1).strip()
-                    # Remove tags HTML residuais
-                    title = re.sub(r'<[^>]+>', '', title).strip()
-                    if title and len(title) > 5 and not title.isdigit():
-                        break
-            
-            # Extrai link usando padrões do scraper Scrapy
-            link = ""
-            link_patterns = [
-                r'<a[^>]*class="[^"]*ui-search-item__group__element[^"]*"[^>]*href="([^"]*)"',
-                r'<a[^>]*class="[^"]*ui-search-link[^"]*"[^>]*href="([^"]*)"',
-                r'<a[^>]*class="[^"]*poly-component__title[^"]*"[^>]*href="([^"]*)"'
-            ]
-            
-            for pattern in link_patterns:
-                link_match = re.search(pattern, container_html)
-                if link_match:
-                    link = link_match.group(1)
-                    if not link.startswith('http'):
-                        link = f"https://www.mercadolivre.com.br{link}"
-                    break
-            
-            # Extrai preço usando padrões do scraper Scrapy
-            price = 0.0
-            price_patterns = [
-                r'class="[^"]*andes-money-amount__fraction[^"]*"[^>]*>([^<]*)</span>',
-                r'ui-search-price__second-line[^>]*>.*?andes-money-amount__fraction[^>]*>([^<]*)</span>',
-                r'poly-price__current[^>]*>.*?andes-money-amount__fraction[^>]*>([^<]*)</span>'
-            ]
-            
-            for pattern in price_patterns:
-                price_match = re.search(pattern, container_html, re.DOTALL)
-                if price_match:
-                    price_str = price_match.group(1).replace('.', '').replace(',', '.')
-                    try:
-                        price = float(price_str)
-                        break
-                    except ValueError:
+            # Os produtos únicos vão para o CSV, o NDJSON e o histórico assim que cada página termina
+            matcher = ProductMatcher()
+            # Índice de alertas com o estado deixado pelas execuções anteriores (antes de qualquer upsert)
+            alert_engine = PriceAlertEngine.from_store(PRODUCT_STORE)
+            run_id = PRODUCT_STORE.start_run()
+            writer = IncrementalCsvWriter(OUTPUT_CSV)
+            ndjson_writer = NdjsonWriter(OUTPUT_NDJSON)
+            try:
+                async for task, products_data in crawl(queries, fetch_page):
+                    site_name = SITE_REGISTRY[task.search.site].name
+                    print(f"\n  🌐 {site_name} | '{task.search.query}' | página {task.page}")
+                    print(f"     URL: {task.url}")
+                
+                    if isinstance(products_data, Exception):
+                        # A página falhou, mas as demais páginas e consultas seguem normalmente
+                        kind = getattr(products_data, "kind", type(products_data).__name__)
+                        failures[kind] = failures.get(kind, 0) + 1
+                        print(f"     ❌ Erro ({kind}): {products_data}")
                         continue
-            
-            # Extrai avaliação usando padrões testados que funcionam
-            rating = 0.0
-            rating_patterns = [
-                # Padrões que funcionaram no teste
-                r'rating[^>]*>([0-9,\.]+)</span>',  # Padrão 5 (funciona)
-                r'reviews__rating[^>]*>([0-9,\.]+)',  # Padrão 9 (funciona)
-                # Padrões adicionais de backup
-                r'class="[^"]*ui-search-reviews__rating-number[^"]*"[^>]*>([0-9,\.]+)</span>',
-                r'ui-search-reviews__rating-number[^>]*>([0-9,\.]+)</span>',
-                r'class="[^"]*ui-search-reviews__rating[^"]*"[^>]*>([0-9,\.]+)</span>',
-                r'rating-number[^>]*>([0-9,\.]+)</span>',
-                r'<span[^>]*>([0-9,\.]+)\s*</span>[^<]*<span[^>]*>\([0-9,\.]+\)</span>',
-                r'([0-9,\.]+)\s*de\s*5\s*estrelas',
-                r'([0-9,\.]+)\s*estrelas?'
-            ]
-            
-            for pattern in rating_patterns:
-                rating_match = re.search(pattern, container_html, re.IGNORECASE)
-                if rating_match:
-                    rating_str = rating_match.group(1).replace(',', '.')
-                    try:
-                        rating = float(rating_str)
-                        if 0 <= rating <= 5:  # Validação de range válido
-                            break
-                    except ValueError:
+                    if not products_data:
+                        print(f"     ❌ Nenhum produto encontrado")
                         continue
-            
-            # Extrai ID MLB do link
-            mlb_id = "N/A"
-            if link:
-                mlb_match = re.search(r'(MLB-[0-9]+)', link)
-                if mlb_match:
-                    mlb_id = mlb_match.group(1)
-            
-            # URL do produto
-            product_url = link if link else f"https://www.mercadolivre.com.br/{mlb_id}"
-            
-            # Disponibilidade (assume em estoque se tem preço)
-            availability = "Em estoque" if price > 0 else "Indisponível"
-            
-            product_data = {
-                "Nome do Produto": title,
-                "Preço (R$)": price,
-                "Avaliação (estrelas)": rating,
-                "URL": product_url,
-                "Disponibilidade": availability,
-                "MLB_ID": mlb_id
-            }
-            
-            products.append(product_data)
-            print(f"    ✅ {title[:50]}... - R$ {price}")
+                
+                    print(f"     ✅ {len(products_data)} produtos extraídos")
+                    # Mostra amostra dos produtos encontrados
+                    for i, product in enumerate(products_data[:3], 1):
+                        name = product.get('Nome do Produto', 'N/A')[:40]
+                        price = product.get('Preço (R$)', 0)
+                        print(f"       {i}. {name}... - R$ {price}")
+                    if len(products_data) > 3:
+                        print(f"       ... e mais {len(products_data) - 3} produtos")
+                
+                    # Remove duplicatas aproximadas e pareia o mesmo produto entre marketplaces
+                    with TRACER.span("dedup", site=task.search.site, produtos=len(products_data)) as span:
+                        comparisons = matcher.comparisons
+                        unique_page = list(dedup_records(products_data, task.search.site, matcher))
+                        span.set(unicos=len(unique_page), comparacoes=matcher.comparisons - comparisons)
+                    # Alertas de preço disparam assim que a página chega, antes do fim do crawl
+                    with TRACER.span("alertas", produtos=len(unique_page)):
+                        for product in unique_page:
+                            alert_engine.check(product)
+                    # A página segue para os destinos e não fica em memória depois deste ponto
+                    writer.write_rows(unique_page)
+                    ndjson_writer.write_rows(unique_page)
+                    with TRACER.span("historico.upsert", linhas=len(unique_page)):
+                        PRODUCT_STORE.upsert_rows(unique_page, run_id)
+            finally:
+                writer.close()
+                ndjson_writer.close()
+                alert_engine.close()
+                PRODUCT_STORE.finish_run(run_id)
+    
+            print(f"\n[FLUXO] 📋 Total de produtos coletados: {ndjson_writer.rows_written}")
+            if alert_engine.counts:
+                print("[FLUXO] 🔔 Alertas de preço: "
+                      + ", ".join(f"{kind}: {count}" for kind, count in alert_engine.counts.items())
+                      + f" (gravados em {ALERT_FILE})")
+            if failures:
+                print("[FLUXO] ⚠️ Páginas com falha: " + ", ".join(f"{kind}: {count}" for kind, count in failures.items()))
+            print(f"[FLUXO] 🔧 {writer.rows_written} produtos únicos gravados em {OUTPUT_CSV} durante a extração "
+                  f"({matcher.comparisons} comparações de títulos)")
+    
+            # ETAPA 2: CONSOLIDAÇÃO E SALVAMENTO
+            if ndjson_writer.rows_written:
+                print(f"\n[FLUXO] 💾 Consolidando e salvando dados...")
         
-        return json.dumps(products, ensure_ascii=False)
+                # O CSV final é ordenado por preço a partir do NDJSON, em fluxo (ordenação externa)
+                if direct:
+                    save_message = write_sorted_csv(OUTPUT_NDJSON, OUTPUT_CSV)
+                else:
+                    # O consolidador recebe só o caminho do arquivo, não os produtos no prompt
+                    final_result = await run_agent(
+                        build_agents()["consolidator_agent"],
+                        input=f"Salve os {ndjson_writer.rows_written} produtos únicos do arquivo "
+                              f"{OUTPUT_NDJSON} em {OUTPUT_CSV}."
+                    )
+                    save_message = final_result.final_output
         
-    except Exception as e:
-        return f"ERRO: {e}"
+                print(f"\n✅ {save_message}")
         
+                # ETAPA 3: MOSTRA RESULTADO FINAL (consultas indexadas no histórico, sem reler o CSV)
+                print_run_summary(run_id)
+            else:
+                print("❌ Nenhum dado válido foi coletado")
+    
+            print(f"\n🎉 SCRAPING CONCLUÍDO!")
+            print("="*60)
     finally:
-        if driver:
-            try:
-                driver.quit()
-            except:
-                pass
+        await HTTP_FETCHER.aclose()
+        EXTRACTION_SCHEDULER.shutdown()
+        DRIVER_POOL.shutdown()
+        PAGE_CACHE.close()
+        PRODUCT_STORE.close()
+        if PAGE_CACHE.enabled:
+            print(f"[CACHE] 📦 {PAGE_CACHE.hits} acertos | {PAGE_CACHE.misses} faltas")
+        metrics = DRIVER_POOL.metrics()
+        print(f"[POOL] 📈 {metrics['emprestimos']} empréstimos | espera média {metrics['espera_media_s']:.2f}s "
+              f"(máx {metrics['espera_max_s']:.2f}s) | {metrics['reinicios']} reinícios")
+        for site, ready in page_ready_metrics().items():
+            print(f"[ESPERA] ⏱️ {site}: {ready['paginas']} páginas | média {ready['media_s']:.2f}s "
+                  f"(máx {ready['max_s']:.2f}s) | economia de {ready['economia_s']:.1f}s vs sleep fixo")
+        for site, stats in HTTP_FETCHER.metrics().items():
+            reasons = ", ".join(f"{reason}: {count}" for reason, count in stats["motivos"].items()) or "-"
+            print(f"[HTTP] 🌐 {site}: {stats['http']} páginas por HTTP | {stats['escalacoes']} escalonamentos "
+                  f"({stats['taxa_escalacao']:.0%}) | motivos: {reasons}")
+        for domain, limits in RATE_LIMITER.metrics().items():
+            print(f"[LIMITE] 🚦 {domain}: {limits['requisicoes']} requisições | "
+                  f"espera total {limits['espera_total_s']:.1f}s")
+        for site, circuit in CIRCUIT_BREAKER.metrics().items():
+            state = "aberto" if circuit["aberto"] else "fechado"
+            print(f"[CIRCUITO] 🛑 {site}: {circuit['aberturas']} pausa(s) | disjuntor {state}")
+        EXTRACTION_PROFILER.dump()
+        if TRACER.enabled:
+            TRACER.close()
+            print(f"[TRACE] 🧭 Spans da execução gravados em {TRACER.path} (trace {TRACER.trace_id})")
+
+# -----------------------------------------------------------
+# Execução em lote: catálogo de consultas dividido entre processos
+# -----------------------------------------------------------
+
+def load_query_file(path: str, sites: List[str], pages: int = 1,
+                    limit: int = PAGE_RESULT_LIMIT) -> List[SearchQuery]:
+    """
+    Lê o catálogo de consultas do lote: uma consulta por linha, opcionalmente precedida
+    do marketplace (`amazon | cartucho hp 664`). Consultas sem marketplace são feitas em
+    todos os `sites`. Linhas vazias ou iniciadas por `#` e consultas repetidas são ignoradas.
+    """
+    queries = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if "|" in line:
+                site, terms = (part.strip() for part in line.split("|", 1))
+                if site not in SITE_REGISTRY:
+                    raise ValueError(f"Marketplace desconhecido na linha {number} de {path}: {site}")
+                line_sites = [site]
+            else:
+                terms, line_sites = line, sites
+            for site in line_sites:
+                search = SearchQuery(site, terms, pages, limit)
+                if batch_key(search) not in seen:
+                    seen.add(batch_key(search))
+                    queries.append(search)
+    return queries
+
+
+def batch_key(search: SearchQuery) -> str:
+    """
+    Identificador da consulta nos checkpoints do lote: marketplace e termos normalizados.
+    """
+    return f"{search.site}|{' '.join(search.query.lower().split())}"
+
+
+def _shard_path(directory: str, index: int, suffix: str) -> str:
+    return os.path.join(directory, f"shard-{index:02d}{suffix}")
+
 
-@function_tool
-def csv_writer_tool(json_data_str: str, filename: str = 'hp_cartridges_search_data.csv') -> str:
+def load_batch_checkpoints(directory: str) -> set:
     """
-    Salva os dados em formato CSV.
+    Consultas já concluídas no diretório do lote, somando os checkpoints de todos os shards.
     """
-    print(f"\n[TOOL] 💾 Gravando dados no arquivo: {filename}")
+    done = set()
+    for path in glob.glob(os.path.join(directory, "shard-*.checkpoint")):
+        for entry in read_ndjson(path):
+            done.add(entry["consulta"])
+    return done
+
+
+def run_batch_shard(index: int, queries: List[SearchQuery], directory: str,
+                    use_cache: bool = True, use_http: bool = HTTP_FETCH_ENABLED,
+                    offline: bool = False) -> Dict:
+    """
+    Ponto de entrada de cada processo do lote. Extrai as consultas do shard no modo
+    direto, com pool de drivers, cliente HTTP e scheduler próprios do processo.
+    """
+    return asyncio.run(_run_batch_shard(index, queries, directory, use_cache, use_http, offline))
+
+
+async def _run_batch_shard(index: int, queries: List[SearchQuery], directory: str,
+                           use_cache: bool, use_http: bool, offline: bool) -> Dict:
+    PAGE_CACHE.enabled = use_cache or offline
+    PAGE_CACHE.offline = offline
+    HTTP_FETCHER.enabled = use_http and not offline
+    if not HTTP_FETCHER.enabled and not offline:
+        DRIVER_POOL.warm_up()
+    print(f"[LOTE] 🧵 Worker {index} (pid {os.getpid()}): {len(queries)} consultas")
     
+    async def fetch_page(task: CrawlTask, limit: int) -> List[Dict]:
+        return await extract_search_products(task.search.site, task.url, limit)
+    
+    stats = {"shard": index, "consultas": 0, "incompletas": 0, "produtos": 0}
+    started = time.perf_counter()
+    # Duplicatas dentro do shard saem já aqui; a consolidação repete a deduplicação entre os shards
+    matcher = ProductMatcher()
+    alert_engine = PriceAlertEngine.from_store(PRODUCT_STORE)
+    output = NdjsonWriter(_shard_path(directory, index, ".ndjson"), append=True)
+    checkpoint = open(_shard_path(directory, index, ".checkpoint"), "a", encoding="utf-8")
+    # Produtos e falhas de cada consulta até a última página dela
+    buffers: Dict[int, List[Dict]] = {index: [] for index in range(len(queries))}
+    failed = set()
     try:
-        data_list = json.loads(json_data_str)
-    except json.JSONDecodeError:
-        return "Erro: A string de dados não está em formato JSON válido."
+        async for task, products_data in crawl(queries, fetch_page):
+            search = task.search
+            if isinstance(products_data, Exception):
+                failed.add(task.query_index)
+                kind = getattr(products_data, "kind", type(products_data).__name__)
+                print(f"[LOTE] ❌ '{search.query}' ({search.site}) página {task.page}: {kind}")
+            elif products_data:
+                unique_page = list(dedup_records(products_data, search.site, matcher))
+                for product in unique_page:
+                    alert_engine.check(product)
+                buffers[task.query_index].extend(unique_page)
+            if not task.last:
+                continue
+            
+            # Consulta terminada: grava os produtos e só então marca o checkpoint,
+            # para que uma consulta interrompida seja refeita por inteiro ao retomar
+            rows = buffers.pop(task.query_index)
+            output.write_rows(rows)
+            stats["produtos"] += len(rows)
+            if task.query_index in failed:
+                stats["incompletas"] += 1
+                continue
+            checkpoint.write(json.dumps({"consulta": batch_key(search), "produtos": len(rows),
+                                         "em": _now_iso()}, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+            stats["consultas"] += 1
+    finally:
+        output.close()
+        checkpoint.close()
+        alert_engine.close()
+        await HTTP_FETCHER.aclose()
+        EXTRACTION_SCHEDULER.shutdown()
+        DRIVER_POOL.shutdown()
+        PAGE_CACHE.close()
+        PRODUCT_STORE.close()
     
-    if isinstance(data_list, list) and data_list:
-        df = pd.DataFrame(data_list)
-        df.to_csv(filename, index=False, encoding='utf-8')
-        return f"Dados de {len(data_list)} produtos salvos com sucesso em {filename}."
-    else:
-        return "A lista de dados estava vazia. Arquivo CSV não gerado."
+    stats["segundos"] = time.perf_counter() - started
+    stats["alertas"] = sum(alert_engine.counts.values())
+    return stats
 
-# -----------------------------------------------------------
-# 3. DEFINIÇÃO DOS AGENTES
-# -----------------------------------------------------------
 
-# AGENTE AMAZON: Extrai dados da página de busca da Amazon
-amazon_agent = Agent(
-    name="Agente Amazon Search",
-    model=MODEL_NAME, 
-    instructions="""
-    Use a ferramenta 'extract_amazon_search_data' para extrair dados de produtos diretamente da página de busca da Amazon.
-    Esta ferramenta já faz toda a extração usando regex otimizado.
-    Retorne APENAS o resultado da ferramenta, sem nenhum texto adicional.
-    O resultado já é um JSON válido de lista de produtos.
-    """,
-    tools=[extract_amazon_search_data], 
-)
-
-# AGENTE MERCADO LIVRE: Extrai dados da página de busca do Mercado Livre
-mercadolivre_agent = Agent(
-    name="Agente Mercado Livre Search",
-    model=MODEL_NAME, 
-    instructions="""
-    Use a ferramenta 'extract_mercadolivre_search_data' para extrair dados de produtos diretamente da página de busca do Mercado Livre.
-    Esta ferramenta já faz toda a extração usando seletores CSS otimizados.
-    Retorne APENAS o resultado da ferramenta, sem nenhum texto adicional.
-    O resultado já é um JSON válido de lista de produtos.
-    """,
-    tools=[extract_mercadolivre_search_data], 
-)
-
-# AGENTE CONSOLIDADOR: Combina e salva dados
-consolidator_agent = Agent(
-    name="Agente Consolidador",
-    model=MODEL_NAME, 
-    instructions="Receba listas de dados de produtos, combine-as em uma única lista JSON e use a 'csv_writer_tool' para salvar.",
-    tools=[csv_writer_tool],
-)
+def merge_batch_outputs(directory: str) -> Optional[int]:
+    """
+    Consolida as saídas dos shards: deduplica os produtos de todos os shards, grava o
+    NDJSON e o CSV ordenado do lote e faz o upsert no histórico dos produtos dos shards
+    ainda não consolidados (em uma nova execução). Os arquivos consolidados são renomeados com o
+    número da execução, para que uma retomada não registre os mesmos preços de novo.
+    Devolve o número da execução, ou None se não havia produtos novos.
+    """
+    merged = sorted(glob.glob(os.path.join(directory, "shard-*.execucao-*.ndjson")))
+    fresh = sorted(path for path in glob.glob(os.path.join(directory, "shard-*.ndjson")) if path not in merged)
+    # Shards cujas consultas falharam todas ficam vazios: não abrem uma execução sem produtos
+    for path in [path for path in fresh if os.path.getsize(path) == 0]:
+        fresh.remove(path)
+        os.remove(path)
+    if not fresh:
+        return None
+    
+    ndjson_path = os.path.join(directory, OUTPUT_NDJSON)
+    matcher = ProductMatcher()
+    run_id = PRODUCT_STORE.start_run()
+    writer = NdjsonWriter(ndjson_path)
+    try:
+        with TRACER.span("lote.consolidacao", shards=len(fresh), consolidados=len(merged)):
+            # Os shards novos vêm primeiro: entre duplicatas, fica a observação mais recente
+            for path in fresh + merged:
+                for batch in _batches(read_ndjson(path), 1000):
+                    unique = []
+                    for site in SITE_REGISTRY:
+                        rows = [row for row in batch if site_of_row(row) == site]
+                        unique.extend(dedup_records(rows, site, matcher))
+                    writer.write_rows(unique)
+                    if path in fresh:
+                        PRODUCT_STORE.upsert_rows(unique, run_id)
+    finally:
+        writer.close()
+        PRODUCT_STORE.finish_run(run_id)
+    
+    for path in fresh:
+        os.replace(path, path[:-len(".ndjson")] + f".execucao-{run_id}.ndjson")
+    print(f"[LOTE] 🧩 {writer.rows_written} produtos únicos de {len(merged) + len(fresh)} arquivos de shard")
+    print(f"✅ {write_sorted_csv(ndjson_path, os.path.join(directory, OUTPUT_CSV))}")
+    return run_id
 
-# -----------------------------------------------------------
-# 4. ORQUESTRAÇÃO PRINCIPAL
-# -----------------------------------------------------------
 
-async def main():
-    print("🚀 INÍCIO DO SCRAPING DE CARTUCHOS HP - PÁGINAS DE BUSCA")
+def run_batch(queries: List[SearchQuery], directory: str = BATCH_DIR, workers: int = BATCH_WORKERS,
+              use_cache: bool = True, use_http: bool = HTTP_FETCH_ENABLED, offline: bool = False) -> Dict:
+    """
+    Executa um catálogo de consultas em `workers` processos, no modo direto. As consultas
+    pendentes (sem checkpoint em `directory`) são distribuídas em rodízio entre os shards;
+    cada processo tem seu próprio pool de drivers e grava o próprio NDJSON e checkpoint.
+    Ao final, as saídas dos shards são consolidadas no histórico. Executar de novo com o
+    mesmo diretório retoma o lote a partir das consultas que faltam.
+    """
+    os.makedirs(directory, exist_ok=True)
+    done = load_batch_checkpoints(directory)
+    pending = [search for search in queries if batch_key(search) not in done]
+    workers = max(1, min(workers, len(pending)))
+    shards = [pending[index::workers] for index in range(workers)] if pending else []
+    print("🚀 LOTE DE CONSULTAS DE CARTUCHOS HP")
     print("="*60)
+    print(f"[LOTE] 📚 {len(queries)} consultas | {len(queries) - len(pending)} já concluídas | "
+          f"{len(pending)} pendentes em {len(shards)} processos")
+    if len(shards) > 1 and use_http and not offline:
+        # Cada processo tem o próprio limitador: o ritmo total por domínio soma o de todos
+        print(f"[LIMITE] 🚦 Até {DOMAIN_RATE_LIMIT * len(shards):.2f} requisições/s por domínio "
+              f"({len(shards)} processos × DOMAIN_RATE_LIMIT)")
     
-    all_products = []
+    started = time.perf_counter()
+    crashed = 0
+    if shards:
+        # spawn: cada processo começa limpo, sem herdar threads, drivers ou conexões SQLite
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as executor:
+            futures = {
+                executor.submit(run_batch_shard, index, shard, directory, use_cache, use_http, offline): index
+                for index, shard in enumerate(shards)
+            }
+            for future in as_completed(futures):
+                try:
+                    stats = future.result()
+                except Exception as e:
+                    crashed += 1
+                    print(f"[LOTE] 💥 Worker {futures[future]} interrompido: {e!r}")
+                    continue
+                print(f"[LOTE] ✅ Worker {stats['shard']}: {stats['consultas']} consultas concluídas, "
+                      f"{stats['incompletas']} incompletas | {stats['produtos']} produtos | "
+                      f"{stats['alertas']} alertas | {stats['segundos']:.1f}s")
+    elapsed = time.perf_counter() - started
     
-    search_configs = [
-        {
-            "name": "Amazon Brasil",
-            "url": "https://www.amazon.com.br/s?k=cartucho+hp+664+original",
-            "agent": amazon_agent
-        },
-        {
-            "name": "Mercado Livre Brasil", 
-            "url": "https://lista.mercadolivre.com.br/cartucho-hp-662",
-            "agent": mercadolivre_agent
-        }
-    ]
+    remaining = len([search for search in queries if batch_key(search) not in load_batch_checkpoints(directory)])
+    finished = len(pending) - remaining
+    if shards:
+        print(f"[LOTE] ⏱️ {finished} consultas em {elapsed:.1f}s ({finished / elapsed if elapsed else 0:.2f} consultas/s)")
     
-    # ETAPA 1: EXTRAÇÃO DE DADOS DAS PÁGINAS DE BUSCA
-    print(f"\n[FLUXO] 📊 Extraindo dados de {len(search_configs)} páginas de busca...")
+    run_id = merge_batch_outputs(directory)
+    if run_id is not None:
+        print_run_summary(run_id)
+        PRODUCT_STORE.close()
+    if remaining or crashed:
+        print(f"\n[LOTE] ⚠️ {remaining} consultas pendentes: execute o mesmo comando de novo para retomar "
+              f"(diretório {directory})")
+    else:
+        print(f"\n🎉 LOTE CONCLUÍDO!")
+    print("="*60)
+    return {"consultas": len(queries), "concluidas": finished, "pendentes": remaining,
+            "falhas_de_processo": crashed, "execucao": run_id}
+
+# Comandos da linha de comando (sem comando explícito, executa o scraping)
+CLI_COMMANDS = ("scrape", "relatorio", "lote")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scraping de cartuchos HP na Amazon e no Mercado Livre.")
+    subparsers = parser.add_subparsers(dest="command")
     
-    for config in search_configs:
-        print(f"\n  🌐 Processando: {config['name']}")
-        print(f"     URL: {config['url']}")
-        
-        try:
-            result = await Runner.run(
-                config['agent'], 
-                input=f"Extraia todos os dados de produtos desta URL: {config['url']}"
-            )
-            
-            products_data = json.loads(result.final_output.strip())
-            
-            if isinstance(products_data, list) and products_data:
-                all_products.extend(products_data)
-                print(f"     ✅ {len(products_data)} produtos extraídos")
-                
-                # Mostra amostra dos produtos encontrados
-                for i, product in enumerate(products_data[:3], 1):
-                    name = product.get('Nome do Produto', 'N/A')[:40]
-                    price = product.get('Preço (R$)', 0)
-                    print(f"       {i}. {name}... - R$ {price}")
-                
-                if len(products_data) > 3:
-                    print(f"       ... e mais {len(products_data) - 3} produtos")
-            else:
-                print(f"     ❌ Nenhum produto encontrado")
-        
-        except Exception as e:
-            print(f"     ❌ Erro: {e}")
+    scrape = subparsers.add_parser("scrape", help="Executa o scraping (comando padrão).")
+    scrape.add_argument(
+        "--direct", action="store_true",
+        help="Executa extração e gravação do CSV diretamente, sem chamadas ao LLM.",
+    )
+    scrape.add_argument(
+        "--query", action="append", dest="queries", metavar="TERMOS",
+        help="Termos de busca (pode ser repetido). Sem esta opção, usa as buscas padrão.",
+    )
+    scrape.add_argument(
+        "--site", action="append", dest="sites", choices=sorted(SITE_REGISTRY),
+        help="Marketplace das buscas de --query (pode ser repetido). Padrão: todos.",
+    )
+    scrape.add_argument("--pages", type=int, default=1, help="Páginas de resultado por consulta.")
+    scrape.add_argument(
+        "--limit", type=int, default=PAGE_RESULT_LIMIT,
+        help="Máximo de produtos por consulta (somando todas as páginas).",
+    )
+    scrape.add_argument("--no-cache", action="store_true", help="Ignora o cache de páginas em disco.")
+    scrape.add_argument(
+        "--no-http", action="store_true",
+        help="Desativa a camada HTTP e abre todas as páginas no Selenium.",
+    )
+    scrape.add_argument(
+        "--offline", action="store_true",
+        help="Usa apenas páginas do cache (mesmo vencidas), sem acessar a rede.",
+    )
+    scrape.add_argument(
+        "--reparse-cache", action="store_true",
+        help="Reaplica as regras de extração a todo o HTML em cache e encerra.",
+    )
+    scrape.add_argument(
+        "--trace", metavar="ARQUIVO",
+        help="Grava os spans de cada etapa em JSON lines (sobrepõe TRACE_FILE).",
+    )
     
-    print(f"\n[FLUXO] 📋 Total de produtos coletados: {len(all_products)}")
+    report = subparsers.add_parser("relatorio", help="Relatório de preços sobre o histórico em SQLite.")
+    report.add_argument("--execucao", type=int, help="Execução analisada. Padrão: a mais recente.")
+    report.add_argument("--top", type=int, default=10, help="Linhas exibidas por tabela.")
+    report.add_argument("--saida", metavar="DIRETORIO", help="Grava cada tabela do relatório em CSV neste diretório.")
     
-    # ETAPA 2: CONSOLIDAÇÃO E SALVAMENTO
-    if all_products:
-        print(f"\n[FLUXO] 💾 Consolidando e salvando dados...")
-        
-        # Remove duplicatas baseado no nome do produto
-        unique_products = []
-        seen_names = set()
-        
-        for product in all_products:
-            name = product.get('Nome do Produto', '').lower().strip()
-            if name and name not in seen_names and len(name) > 5:
-                seen_names.add(name)
-                unique_products.append(product)
-        
-        print(f"[FLUXO] 🔧 {len(unique_products)} produtos únicos após remoção de duplicatas")
-        
-        # Ordena por preço
-        unique_products.sort(key=lambda x: x.get('Preço (R$)', 0), reverse=True)
-        
-        data_json = json.dumps(unique_products, ensure_ascii=False)
-        
-        final_result = await Runner.run(
-            consolidator_agent,
-            input=f"Salve estes {len(unique_products)} produtos únicos: {data_json}"
-        )
-        
-        print(f"\n✅ {final_result.final_output}")
-        
-        # ETAPA 3: MOSTRA RESULTADO FINAL
-        try:
-            df = pd.read_csv('hp_cartridges_search_data.csv')
-            print(f"\n📊 RESUMO DOS DADOS COLETADOS:")
-            print(f"   • Total de produtos: {len(df)}")
-            print(f"   • Preço médio: R$ {df['Preço (R$)'].mean():.2f}")
-            print(f"   • Preço mínimo: R$ {df['Preço (R$)'].min():.2f}")
-            print(f"   • Preço máximo: R$ {df['Preço (R$)'].max():.2f}")
-            print(f"   • Avaliação média: {df['Avaliação (estrelas)'].mean():.1f} estrelas")
-            
-            print(f"\n🏆 TOP 5 PRODUTOS POR PREÇO:")
-            top_5 = df.nlargest(5, 'Preço (R$)')
-            for i, (_, row) in enumerate(top_5.iterrows(), 1):
-                name = row['Nome do Produto'][:50]
-                price = row['Preço (R$)']
-                rating = row['Avaliação (estrelas)']
-                print(f"   {i}. {name}... - R$ {price} ({rating}⭐)")
-            
-        except Exception as e:
-            print(f"❌ Erro ao ler CSV final: {e}")
-    else:
-        print("❌ Nenhum dado válido foi coletado")
+    batch = subparsers.add_parser("lote", help="Processa um catálogo de consultas em vários processos (modo direto).")
+    batch.add_argument("arquivo", help="Catálogo de consultas: uma por linha, opcionalmente `site | termos`.")
+    batch.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Processos de extração.")
+    batch.add_argument(
+        "--diretorio", default=BATCH_DIR,
+        help="Diretório dos shards, checkpoints e saídas do lote (o mesmo diretório retoma o lote).",
+    )
+    batch.add_argument(
+        "--site", action="append", dest="sites", choices=sorted(SITE_REGISTRY),
+        help="Marketplace das consultas sem site no catálogo (pode ser repetido). Padrão: todos.",
+    )
+    batch.add_argument("--pages", type=int, default=1, help="Páginas de resultado por consulta.")
+    batch.add_argument(
+        "--limit", type=int, default=PAGE_RESULT_LIMIT,
+        help="Máximo de produtos por consulta (somando todas as páginas).",
+    )
+    batch.add_argument("--no-cache", action="store_true", help="Ignora o cache de páginas em disco.")
+    batch.add_argument(
+        "--no-http", action="store_true",
+        help="Desativa a camada HTTP e abre todas as páginas no Selenium.",
+    )
+    batch.add_argument(
+        "--offline", action="store_true",
+        help="Usa apenas páginas do cache (mesmo vencidas), sem acessar a rede.",
+    )
     
-    print(f"\n🎉 SCRAPING CONCLUÍDO!")
-    print("="*60)
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Mantém `python agentsSDK.py --direct ...` funcionando como antes
+    if not argv or (argv[0] not in CLI_COMMANDS and argv[0] not in ("-h", "--help")):
+        argv = ["scrape"] + argv
+    return parser.parse_args(argv)
+
+def build_queries(args) -> List[SearchQuery]:
+    """
+    Monta as consultas do crawl a partir dos argumentos de linha de comando.
+    """
+    if not args.queries:
+        return [SearchQuery(search.site, search.query, args.pages, args.limit) for search in DEFAULT_QUERIES]
+    sites = args.sites or list(SITE_REGISTRY)
+    return [SearchQuery(site, query, args.pages, args.limit) for query in args.queries for site in sites]
 
 # Comando de execução final:
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    args = parse_args()
+    if args.command == "relatorio":
+        price_report = build_price_report(run_id=args.execucao)
+        print_price_report(price_report, top=args.top)
+        if args.saida:
+            for path in save_price_report(price_report, args.saida):
+                print(f"💾 {path}")
+        sys.exit(0)
+    if args.command == "lote":
+        try:
+            batch_queries = load_query_file(args.arquivo, args.sites or list(SITE_REGISTRY),
+                                            args.pages, args.limit)
+        except (OSError, ValueError) as e:
+            sys.exit(f"❌ {e}")
+        batch_result = run_batch(batch_queries, args.diretorio, args.workers,
+                                 use_cache=not args.no_cache,
+                                 use_http=HTTP_FETCH_ENABLED and not args.no_http,
+                                 offline=args.offline)
+        # Código 1 quando sobram consultas: permite repetir o comando até o lote terminar
+        sys.exit(1 if batch_result["pendentes"] or batch_result["falhas_de_processo"] else 0)
+    if args.trace:
+        TRACER.configure(args.trace)
+    if args.reparse_cache:
+        for url, count in reparse_cache().items():
+            print(f"[CACHE] 🔁 {count:4d} produtos | {url}")
+    else:
+        asyncio.run(main(direct=args.direct, queries=build_queries(args),
+                         offline=args.offline, use_cache=not args.no_cache,
+                         use_http=HTTP_FETCH_ENABLED and not args.no_http))
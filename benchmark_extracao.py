@@ -0,0 +1,610 @@
+"""
+Benchmark offline do motor de extração, com páginas de busca salvas em fixtures/.
+
+Para cada página (as fixtures da Amazon e do Mercado Livre e páginas sintéticas
+com centenas de contêineres geradas a partir delas) mede o tempo de parsing, o
+pico de memória e a taxa de acerto de cada padrão das cascatas de campos. Nas
+fixtures, confere antes que o motor reproduz exatamente a implementação original
+(cascatas de re.search recompiladas a cada campo) e mostra o speedup.
+
+Uso:
+    python benchmark_extracao.py [--repeat 50] [--synthetic 200 1000]
+    python benchmark_extracao.py --save-baseline benchmark_baseline.json
+    python benchmark_extracao.py --baseline benchmark_baseline.json --max-regression 0.25
+    python benchmark_extracao.py --http [--repeat 50]
+    python benchmark_extracao.py --memoria [--synthetic 200 1000]
+
+Com --baseline, o script termina com código 1 se alguma página ficar mais lenta
+que a referência além da tolerância, o que permite rodá-lo antes do deploy.
+
+Com --http, sobe um servidor HTTP local que serve as fixtures (e páginas de
+bloqueio) e mede a camada HTTP do scraper contra ele, conferindo em quais
+páginas ela escala para o Selenium.
+
+Com --memoria, compara o pico de memória por página da implementação original
+(re.findall sobre a página inteira), da versão anterior do motor (lista de todos
+os contêineres e uma cópia de cada um) e do motor atual (contêineres sob demanda,
+campos buscados por posição no HTML), com o limite de 10 produtos e sem limite.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from agentsSDK import SITE_REGISTRY, HttpFetcher, ProductRecord, parse_search_html
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Fixture de cada marketplace
+FIXTURES = {
+    "amazon": "amazon_busca.html",
+    "mercadolivre": "mercadolivre_busca.html",
+}
+
+# Como trocar o identificador de cada contêiner ao gerar páginas sintéticas
+_ID_REWRITES = {
+    "amazon": (re.compile(r'data-asin="[A-Z0-9]{10}"'), lambda n: f'data-asin="B{n:09d}"'),
+    "mercadolivre": (re.compile(r'MLB-[0-9]+'), lambda n: f"MLB-{9000000000 + n}"),
+}
+
+
+# -----------------------------------------------------------
+# Implementação original (referência para comparação)
+# -----------------------------------------------------------
+
+def legacy_parse_amazon_html(html_content: str) -> List[Dict]:
+    products = []
+    product_pattern = r'<div[^>]*data-asin="([A-Z0-9]{10})"[^>]*data-component-type="s-search-result"[^>]*>(.*?)</div>\s*</div>\s*</div>\s*</span>'
+    matches = re.findall(product_pattern, html_content, re.DOTALL)
+    
+    for asin, product_html in matches[:10]:
+        title_patterns = [
+            r'<h2[^>]*>(.*?)</h2>',
+            r'<span[^>]*class="[^"]*a-size-base-plus[^"]*"[^>]*>([^<]*)</span>',
+            r'title":{"text":"([^"]*)"'
+        ]
+        title = "N/A"
+        for pattern in title_patterns:
+            title_match = re.search(pattern, product_html, re.DOTALL)
+            if title_match:
+                title = re.sub(r'<[^>]+>', '', title_match.group(1)).strip()
+                if title and len(title) > 10:
+                    break
+        
+        price = 0.0
+        price_patterns = [
+            r'<span class="a-price-whole">([0-9,]+)</span><span class="a-price-fraction">([0-9]{2})</span>',
+            r'R\$\s*([0-9,]+[.,][0-9]{2})',
+            r'"price":([0-9.]+)'
+        ]
+        for pattern in price_patterns:
+            price_match = re.search(pattern, product_html)
+            if price_match:
+                if len(price_match.groups()) == 2:
+                    whole, fraction = price_match.groups()
+                    price = float(whole.replace(',', '') + '.' + fraction)
+                else:
+                    price = float(price_match.group(1).replace(',', '.'))
+                break
+        
+        rating = 0.0
+        rating_patterns = [
+            r'aria-hidden="true" class="a-size-small a-color-base">([0-9,]+)</span>',
+            r'"rating_average":([0-9.]+)',
+            r'([0-9,]+) de 5 estrelas'
+        ]
+        for pattern in rating_patterns:
+            rating_match = re.search(pattern, product_html)
+            if rating_match:
+                rating = float(rating_match.group(1).replace(',', '.'))
+                break
+        
+        products.append({
+            "Nome do Produto": title,
+            "Preço (R$)": price,
+            "Avaliação (estrelas)": rating,
+            "URL": f"https://www.amazon.com.br/dp/{asin}",
+            "Disponibilidade": "Em estoque" if price > 0 else "Indisponível",
+            "ASIN": asin
+        })
+    return products
+
+
+def legacy_parse_mercadolivre_html(html_content: str) -> List[Dict]:
+    container_patterns = [
+        r'<li[^>]*class="[^"]*ui-search-layout__item[^"]*"[^>]*>(.*?)</li>',
+        r'<div[^>]*class="[^"]*andes-card[^"]*poly-card[^"]*"[^>]*>(.*?)</div>'
+    ]
+    containers = []
+    for pattern in container_patterns:
+        matches = re.findall(pattern, html_content, re.DOTALL)
+        if matches:
+            containers = matches
+            break
+    
+    products = []
+    for container_html in containers[:10]:
+        title = "N/A"
+        title_patterns = [
+            r'<h2[^>]*class="[^"]*ui-search-item__title[^"]*"[^>]*>([^<]+)</h2>',
+            r'<a[^>]*class="[^"]*ui-search-item__group__element[^"]*"[^>]*title="([^"]+)"',
+            r'class="[^"]*ui-search-item__title[^"]*"[^>]*>([^<]+)<',
+            r'<span[^>]*class="[^"]*ui-search-item__title[^"]*"[^>]*>([^<]+)</span>',
+            r'<a[^>]*class="[^"]*poly-component__title[^"]*"[^>]*>([^<]+)</a>',
+            r'ui-search-item__title[^>]*>([^<]{10,})<',
+            r'title="([^"]{10,})"[^>]*ui-search',
+            r'<a[^>]*>([^<]{15,})</a>[^<]*cartucho|hp',
+        ]
+        for pattern in title_patterns:
+            title_match = re.search(pattern, container_html, re.IGNORECASE)
+            if title_match:
+                title = title_match.group(1).strip()
+                title = re.sub(r'<[^>]+>', '', title).strip()
+                if title and len(title) > 5 and not title.isdigit():
+                    break
+        
+        link = ""
+        link_patterns = [
+            r'<a[^>]*class="[^"]*ui-search-item__group__element[^"]*"[^>]*href="([^"]*)"',
+            r'<a[^>]*class="[^"]*ui-search-link[^"]*"[^>]*href="([^"]*)"',
+            r'<a[^>]*class="[^"]*poly-component__title[^"]*"[^>]*href="([^"]*)"'
+        ]
+        for pattern in link_patterns:
+            link_match = re.search(pattern, container_html)
+            if link_match:
+                link = link_match.group(1)
+                if not link.startswith('http'):
+                    link = f"https://www.mercadolivre.com.br{link}"
+                break
+        
+        price = 0.0
+        price_patterns = [
+            r'class="[^"]*andes-money-amount__fraction[^"]*"[^>]*>([^<]*)</span>',
+            r'ui-search-price__second-line[^>]*>.*?andes-money-amount__fraction[^>]*>([^<]*)</span>',
+            r'poly-price__current[^>]*>.*?andes-money-amount__fraction[^>]*>([^<]*)</span>'
+        ]
+        for pattern in price_patterns:
+            price_match = re.search(pattern, container_html, re.DOTALL)
+            if price_match:
+                price_str = price_match.group(1).replace('.', '').replace(',', '.')
+                try:
+                    price = float(price_str)
+                    break
+                except ValueError:
+                    continue
+        
+        rating = 0.0
+        rating_patterns = [
+            r'rating[^>]*>([0-9,\.]+)</span>',
+            r'reviews__rating[^>]*>([0-9,\.]+)',
+            r'class="[^"]*ui-search-reviews__rating-number[^"]*"[^>]*>([0-9,\.]+)</span>',
+            r'ui-search-reviews__rating-number[^>]*>([0-9,\.]+)</span>',
+            r'class="[^"]*ui-search-reviews__rating[^"]*"[^>]*>([0-9,\.]+)</span>',
+            r'rating-number[^>]*>([0-9,\.]+)</span>',
+            r'<span[^>]*>([0-9,\.]+)\s*</span>[^<]*<span[^>]*>\([0-9,\.]+\)</span>',
+            r'([0-9,\.]+)\s*de\s*5\s*estrelas',
+            r'([0-9,\.]+)\s*estrelas?'
+        ]
+        for pattern in rating_patterns:
+            rating_match = re.search(pattern, container_html, re.IGNORECASE)
+            if rating_match:
+                try:
+                    rating = float(rating_match.group(1).replace(',', '.'))
+                    if 0 <= rating <= 5:
+                        break
+                except ValueError:
+                    continue
+        
+        mlb_id = "N/A"
+        if link:
+            mlb_match = re.search(r'(MLB-[0-9]+)', link)
+            if mlb_match:
+                mlb_id = mlb_match.group(1)
+        
+        products.append({
+            "Nome do Produto": title,
+            "Preço (R$)": price,
+            "Avaliação (estrelas)": rating,
+            "URL": link if link else f"https://www.mercadolivre.com.br/{mlb_id}",
+            "Disponibilidade": "Em estoque" if price > 0 else "Indisponível",
+            "MLB_ID": mlb_id
+        })
+    return products
+
+
+def eager_parse_search_html(site: str, html_content: str, limit: Optional[int]) -> List[ProductRecord]:
+    """
+    Versão anterior do motor: lista todos os contêineres da página antes de aplicar o
+    limite e copia cada contêiner (e a versão em minúsculas) antes de extrair os campos.
+    """
+    extractor = SITE_REGISTRY[site]
+    containers = []
+    for container_rule in extractor.containers:
+        containers = list(container_rule.finditer(html_content))
+        if containers:
+            break
+    if limit is not None:
+        containers = containers[:limit]
+    
+    products = []
+    for opening, body_start, body_end in containers:
+        container_html = html_content[body_start:body_end]
+        lowered = container_html.lower()
+        fields = {name: rule.extract(container_html, lowered) for name, rule in extractor.fields.items()}
+        product_id = extractor.id_rule.resolve(opening, fields)
+        url = fields.get(extractor.url_field) if extractor.url_field else None
+        products.append(ProductRecord(site, product_id, fields["title"], fields["price"], fields["rating"],
+                                      url or extractor.url_template.format(id=product_id)))
+    return products
+
+
+# -----------------------------------------------------------
+# Páginas de benchmark
+# -----------------------------------------------------------
+
+class BenchPage:
+    __slots__ = ("name", "site", "html", "legacy")
+
+    def __init__(self, name: str, site: str, html: str, legacy=None):
+        self.name = name
+        self.site = site
+        self.html = html
+        self.legacy = legacy
+
+
+LEGACY_PARSERS = {
+    "amazon": legacy_parse_amazon_html,
+    "mercadolivre": legacy_parse_mercadolivre_html,
+}
+
+
+def load_fixture(site: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, FIXTURES[site]), encoding="utf-8") as f:
+        return f.read()
+
+
+def synthetic_page(site: str, html: str, containers: int) -> str:
+    """
+    Gera uma página com `containers` produtos repetindo os contêineres da fixture,
+    cada cópia com um identificador único, mantendo o cabeçalho e o rodapé originais.
+    """
+    rule = SITE_REGISTRY[site].containers[0]
+    spans = []
+    for opening, _, body_end in rule.finditer(html):
+        closing = rule.close_re.match(html, body_end)
+        spans.append((opening.start(), closing.end()))
+    items = [html[start:end] for start, end in spans]
+    pattern, new_id = _ID_REWRITES[site]
+    body = "\n".join(
+        pattern.sub(new_id(n), items[n % len(items)], count=1) for n in range(containers)
+    )
+    return html[:spans[0][0]] + body + html[spans[-1][1]:]
+
+
+def build_pages(synthetic_sizes: List[int]) -> List[BenchPage]:
+    pages = []
+    for site in FIXTURES:
+        html = load_fixture(site)
+        pages.append(BenchPage(FIXTURES[site], site, html, LEGACY_PARSERS[site]))
+        for size in synthetic_sizes:
+            pages.append(BenchPage(f"{site}_sintetica_{size}", site, synthetic_page(site, html, size)))
+    return pages
+
+
+# -----------------------------------------------------------
+# Medições
+# -----------------------------------------------------------
+
+def _timings(func, repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _memory_peak(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _hit_rates(page: BenchPage) -> Dict[str, List[float]]:
+    field_hits: Dict[str, List[int]] = {}
+    parse_search_html(page.site, page.html, limit=None, field_hits=field_hits)
+    rates = {}
+    for name, hits in field_hits.items():
+        total = sum(hits) or 1
+        rates[name] = [count / total for count in hits]
+    return rates
+
+
+def benchmark_page(page: BenchPage, repeat: int) -> Dict:
+    """
+    Mede uma página: tempo de parsing (melhor e mediana), pico de memória,
+    taxas de acerto por padrão e, nas fixtures, comparação com a versão original.
+    """
+    result = {"pagina": page.name, "caracteres": len(page.html)}
+    
+    if page.legacy is not None:
+        expected = page.legacy(page.html)
+        produced = [product.to_row() for product in parse_search_html(page.site, page.html, limit=10)]
+        if produced != expected:
+            raise SystemExit(f"❌ {page.name}: o motor não reproduz a saída da implementação original")
+        legacy_times = _timings(lambda: page.legacy(page.html), repeat)
+        engine_times = _timings(lambda: parse_search_html(page.site, page.html, limit=10), repeat)
+        result["speedup_top10"] = min(legacy_times) / min(engine_times)
+    
+    parse_all = lambda: parse_search_html(page.site, page.html, limit=None)
+    result["produtos"] = len(parse_all())
+    times = _timings(parse_all, repeat)
+    result["melhor_ms"] = min(times) * 1000
+    result["mediana_ms"] = statistics.median(times) * 1000
+    result["pico_memoria_kb"] = _memory_peak(parse_all) / 1024
+    result["acertos"] = _hit_rates(page)
+    return result
+
+
+def benchmark_memory(page: BenchPage) -> Dict:
+    """
+    Pico de memória do parsing de uma página: original, versão anterior e motor atual,
+    com o limite de 10 produtos e com a página inteira. Confere antes que as três
+    versões produzem os mesmos produtos.
+    """
+    legacy = LEGACY_PARSERS[page.site]
+    for limit in (10, None):
+        produced = [product.to_row() for product in parse_search_html(page.site, page.html, limit=limit)]
+        eager = [product.to_row() for product in eager_parse_search_html(page.site, page.html, limit)]
+        if produced != eager or (limit == 10 and produced != legacy(page.html)):
+            raise SystemExit(f"❌ {page.name}: as versões do motor divergem (limite {limit})")
+    
+    return {
+        "pagina": page.name,
+        "caracteres": len(page.html),
+        "top10_kb": {
+            "original": _memory_peak(lambda: legacy(page.html)) / 1024,
+            "anterior": _memory_peak(lambda: eager_parse_search_html(page.site, page.html, 10)) / 1024,
+            "atual": _memory_peak(lambda: parse_search_html(page.site, page.html, limit=10)) / 1024,
+        },
+        "todos_kb": {
+            "anterior": _memory_peak(lambda: eager_parse_search_html(page.site, page.html, None)) / 1024,
+            "atual": _memory_peak(lambda: parse_search_html(page.site, page.html, limit=None)) / 1024,
+        },
+    }
+
+
+def print_memory_result(result: Dict):
+    print(f"\n📄 {result['pagina']} ({result['caracteres']} caracteres)")
+    for label, key in (("10 produtos", "top10_kb"), ("Página inteira", "todos_kb")):
+        peaks = result[key]
+        values = " | ".join(f"{version} {peak:.0f} KB" for version, peak in peaks.items())
+        reference = peaks.get("original", peaks["anterior"])
+        print(f"   • {label}: {values} ({reference / max(peaks['atual'], 0.001):.1f}x menos)")
+
+
+def print_result(result: Dict):
+    print(f"\n📄 {result['pagina']} ({result['caracteres']} caracteres, {result['produtos']} produtos)")
+    print(f"   • Parsing: {result['melhor_ms']:.2f} ms (mediana {result['mediana_ms']:.2f} ms)")
+    print(f"   • Pico de memória: {result['pico_memoria_kb']:.0f} KB")
+    if "speedup_top10" in result:
+        print(f"   • Speedup vs. original (10 produtos): {result['speedup_top10']:.2f}x")
+    for field, rates in result["acertos"].items():
+        labels = [f"p{i}" for i in range(len(rates) - 1)] + ["padrão"]
+        used = " | ".join(f"{label} {rate:.0%}" for label, rate in zip(labels, rates) if rate)
+        print(f"   • {field}: {used}")
+
+
+def check_regressions(results: List[Dict], baseline_path: str, max_regression: float) -> List[str]:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    failures = []
+    for result in results:
+        reference = baseline.get(result["pagina"])
+        if reference and result["melhor_ms"] > reference * (1 + max_regression):
+            failures.append(
+                f"{result['pagina']}: {result['melhor_ms']:.2f} ms vs. referência {reference:.2f} ms"
+            )
+    return failures
+
+
+# -----------------------------------------------------------
+# Camada HTTP contra um servidor local
+# -----------------------------------------------------------
+
+# Páginas de bloqueio servidas pelo servidor local, por marketplace
+CHALLENGE_PAGES = {
+    "amazon": '<html><body><form action="/errors/validateCaptcha">'
+              '<h4>Digite os caracteres que você vê abaixo</h4></form></body></html>',
+    "mercadolivre": '<html><body><div id="account-verification">'
+                    '<p>Detectamos tráfego incomum (suspicious-traffic)</p></div></body></html>',
+}
+
+# Rota do servidor local -> (status, tipo de página, escalonamento esperado)
+HTTP_ROUTES = {
+    "busca": (200, "fixture", None),
+    "bloqueio": (200, "desafio", "desafio"),
+    "vazia": (200, "vazia", "sem_conteineres"),
+    "indisponivel": (503, "vazia", "http_503"),
+}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """
+    Serve `/<site>/<rota>` com a fixture do marketplace ou uma página de bloqueio,
+    comprimindo com gzip quando o cliente aceita.
+    """
+    protocol_version = "HTTP/1.1"
+    # Cabeçalho e corpo saem em escritas separadas: sem isso, cada resposta espera o ACK atrasado
+    disable_nagle_algorithm = True
+    pages: Dict[str, Dict[str, str]] = {}
+
+    def do_GET(self):
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] not in self.pages or parts[1] not in HTTP_ROUTES:
+            self.send_error(404)
+            return
+        status, kind, _ = HTTP_ROUTES[parts[1]]
+        body = self.pages[parts[0]][kind].encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, 6)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_fixtures() -> ThreadingHTTPServer:
+    """
+    Sobe o servidor local em uma porta livre, em uma thread daemon.
+    """
+    FixtureHandler.pages = {
+        site: {
+            "fixture": load_fixture(site),
+            "desafio": CHALLENGE_PAGES[site],
+            "vazia": "<html><body><p>Nenhum resultado.</p></body></html>",
+        }
+        for site in FIXTURES
+    }
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def benchmark_http(repeat: int) -> Dict:
+    """
+    Busca cada rota de cada marketplace `repeat` vezes com a camada HTTP e confere os escalonamentos.
+    """
+    server = serve_fixtures()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    fetcher = HttpFetcher(enabled=True)
+    latencies: Dict[str, List[float]] = {}
+    failures = []
+    try:
+        for site in FIXTURES:
+            for route, (_, _, expected) in HTTP_ROUTES.items():
+                url = f"{base_url}/{site}/{route}"
+                before = fetcher.metrics().get(site, {"motivos": {}})["motivos"].get(expected, 0)
+                times = latencies.setdefault(f"{site}/{route}", [])
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    html = await fetcher.fetch(site, url)
+                    times.append(time.perf_counter() - start)
+                    if (html is None) != (expected is not None):
+                        failures.append(f"{site}/{route}: escalonamento inesperado")
+                after = fetcher.metrics()[site]["motivos"].get(expected, 0)
+                if expected is not None and after - before != repeat:
+                    failures.append(f"{site}/{route}: motivo esperado '{expected}'")
+    finally:
+        await fetcher.aclose()
+        server.shutdown()
+    return {
+        "latencias_ms": {
+            name: {"mediana": statistics.median(times) * 1000, "melhor": min(times) * 1000}
+            for name, times in latencies.items()
+        },
+        "escalonamentos": fetcher.metrics(),
+        "falhas": sorted(set(failures)),
+    }
+
+
+def print_http_result(result: Dict):
+    print("🌐 Camada HTTP contra o servidor local")
+    for name, latency in result["latencias_ms"].items():
+        print(f"   {name:28s} mediana {latency['mediana']:7.2f} ms | melhor {latency['melhor']:7.2f} ms")
+    for site, stats in result["escalonamentos"].items():
+        reasons = ", ".join(f"{reason}: {count}" for reason, count in stats["motivos"].items())
+        print(f"   {site}: {stats['http']} por HTTP | {stats['escalacoes']} escalonamentos "
+              f"({stats['taxa_escalacao']:.0%}) | {reasons}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline do motor de extração com HTML salvo.")
+    parser.add_argument("--repeat", type=int, default=50, help="Execuções por página.")
+    parser.add_argument(
+        "--synthetic", type=int, nargs="*", default=[200, 1000],
+        help="Tamanhos (em contêineres) das páginas sintéticas geradas a partir das fixtures.",
+    )
+    parser.add_argument("--save-baseline", metavar="ARQUIVO", help="Grava os tempos atuais como referência.")
+    parser.add_argument("--baseline", metavar="ARQUIVO", help="Compara com uma referência gravada.")
+    parser.add_argument(
+        "--max-regression", type=float, default=0.25,
+        help="Piora máxima tolerada em relação à referência (0.25 = 25%%).",
+    )
+    parser.add_argument("--json", action="store_true", help="Imprime os resultados em JSON.")
+    parser.add_argument(
+        "--memoria", action="store_true",
+        help="Compara o pico de memória por página antes e depois do parsing sob demanda.",
+    )
+    parser.add_argument(
+        "--http", action="store_true",
+        help="Mede a camada HTTP contra um servidor local que serve as fixtures.",
+    )
+    args = parser.parse_args(argv)
+    
+    if args.http:
+        result = asyncio.run(benchmark_http(args.repeat))
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+        else:
+            print_http_result(result)
+        if result["falhas"]:
+            print("\n❌ Escalonamentos diferentes do esperado:")
+            for failure in result["falhas"]:
+                print(f"   • {failure}")
+            sys.exit(1)
+        print("\n✅ Escalonamentos conforme o esperado")
+        return
+    
+    if args.memoria:
+        results = [benchmark_memory(page) for page in build_pages(args.synthetic)]
+        if args.json:
+            print(json.dumps(results, ensure_ascii=False, indent=2))
+        else:
+            for result in results:
+                print_memory_result(result)
+        return
+    
+    results = [benchmark_page(page, args.repeat) for page in build_pages(args.synthetic)]
+    
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        for result in results:
+            print_result(result)
+    
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({result["pagina"]: result["melhor_ms"] for result in results}, f, indent=2)
+        print(f"\n💾 Referência gravada em {args.save_baseline}")
+    
+    if args.baseline:
+        failures = check_regressions(results, args.baseline, args.max_regression)
+        if failures:
+            print("\n❌ Regressões de desempenho:")
+            for failure in failures:
+                print(f"   • {failure}")
+            sys.exit(1)
+        print("\n✅ Sem regressões em relação à referência")
+
+
+if __name__ == "__main__":
+    main()